@@ -0,0 +1,207 @@
+"""
+micro-benchmark harness with JSON baselines
+
+a single cProfile run is neither stable nor comparable, this module does
+warmup, calibrates the number of loops per sample, optionally disables the
+gc and keeps the raw samples so that later runs can be compared against them
+with a noise-aware test (Mann-Whitney U)
+
+# usage
+```python
+from datetime import date
+from pathlib import Path
+
+import bench
+import impl_date
+
+
+BASELINE = Path("bench_baseline.json")
+
+results = [
+    bench.bench(impl_date.next_month, date(2024, 1, 31)),
+    bench.bench(impl_date.end_of_month, date(2024, 2, 10)),
+]
+for r in results:
+    print(r)
+
+if BASELINE.exists():
+    bench.assert_no_regression(results, BASELINE, threshold=0.10)
+else:
+    bench.save_baseline(results, BASELINE)
+```
+"""
+
+import gc
+import json
+from pathlib import Path
+import statistics
+import time
+from typing import Any, Callable, Iterable, NamedTuple, Optional
+
+
+class BenchResult(NamedTuple):
+    name    : str
+    loops   : int          # calls per sample
+    samples : list[float]  # seconds per call, one entry per sample
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.samples)
+
+    @property
+    def min(self) -> float:
+        return min(self.samples)
+
+    @property
+    def iqr(self) -> float:
+        if len(self.samples) < 2:
+            return 0.0
+        q1, _, q3 = statistics.quantiles(self.samples, n=4)
+        return q3 - q1
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: median {_fmt_time(self.median)} "
+            f"iqr {_fmt_time(self.iqr)} min {_fmt_time(self.min)} "
+            f"({len(self.samples)} x {self.loops} loops)"
+        )
+
+
+def _fmt_time(s: float) -> str:
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if s >= scale:
+            return f"{s / scale:.3f} {unit}"
+    return f"{s / 1e-9:.1f} ns"
+
+
+def _time_loops(f: Callable, args: tuple, kwargs: dict, loops: int) -> float:
+    it = range(loops)
+    start = time.perf_counter()
+    for _ in it:
+        f(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def _calibrate(f: Callable, args: tuple, kwargs: dict, min_time: float) -> int:
+    """the smallest 1-2-5 loop count for which a sample lasts at least 'min_time'"""
+    loops = 1
+    while True:
+        for mult in (1, 2, 5):
+            n = loops * mult
+            if _time_loops(f, args, kwargs, n) >= min_time:
+                return n
+        loops *= 10
+
+
+def bench(
+    f          : Callable,
+    *args      : Any,
+    name       : Optional[str] = None,
+    repeat     : int = 15,
+    min_time   : float = 0.02,
+    warmup     : float = 0.1,
+    disable_gc : bool = True,
+    **kwargs   : Any,
+) -> BenchResult:
+    """
+    * repeat     : number of samples
+    * min_time   : minimum duration of a single sample, drives the loop count
+    * warmup     : seconds spent calling 'f' before measuring
+    * disable_gc : keep the garbage collector out of the measurements
+    """
+    deadline = time.perf_counter() + warmup
+    while time.perf_counter() < deadline:
+        f(*args, **kwargs)
+    gc_was_enabled = gc.isenabled()
+    if disable_gc:
+        gc.disable()
+    try:
+        loops = _calibrate(f, args, kwargs, min_time)
+        samples = [_time_loops(f, args, kwargs, loops) / loops for _ in range(repeat)]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return BenchResult(name or f.__qualname__, loops, samples)
+
+# =============================================================================
+# baselines
+
+def _load(f: Path) -> dict[str, dict]:
+    if not f.exists():
+        return {}
+    with f.open() as fp:
+        return json.load(fp)
+
+
+def save_baseline(results: Iterable[BenchResult], f: Path):
+    """store (or overwrite) the given results in the json baseline file"""
+    data = _load(f)
+    for r in results:
+        data[r.name] = {"loops": r.loops, "samples": r.samples}
+    with f.open("w") as fp:
+        json.dump(data, fp, indent=2)
+
+
+def _mann_whitney_greater(x: list[float], y: list[float]) -> float:
+    """one-sided p-value of 'x tends to be larger than y' (normal approximation)"""
+    n1, n2 = len(x), len(y)
+    pooled = sorted([(v, 0) for v in x] + [(v, 1) for v in y])
+    n = n1 + n2
+    rank_x = 0.0
+    ties = 0.0
+    i = 0
+    while i < n:
+        j = i
+        while j + 1 < n and pooled[j + 1][0] == pooled[i][0]:
+            j += 1
+        avg_rank = (i + j) / 2 + 1
+        rank_x += avg_rank * sum(1 for k in range(i, j + 1) if pooled[k][1] == 0)
+        t = j - i + 1
+        ties += t ** 3 - t
+        i = j + 1
+    u = rank_x - n1 * (n1 + 1) / 2
+    mean = n1 * n2 / 2
+    var = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1)))
+    if var <= 0:
+        return 1.0
+    z = (u - mean - 0.5) / var ** 0.5
+    return 1 - statistics.NormalDist().cdf(z)
+
+
+class Regression(NamedTuple):
+    name     : str
+    slowdown : float  # relative change of the median, 0.25 is 25% slower
+    p_value  : float
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.slowdown:+.1%} slower than baseline (p={self.p_value:.4f})"
+
+
+def compare(result: BenchResult, baseline_samples: list[float], threshold: float = 0.05, alpha: float = 0.01) -> Optional[Regression]:
+    """
+    a Regression when the median got slower by more than 'threshold' AND the
+    samples are significantly larger than the baseline ones, None otherwise
+    """
+    slowdown = result.median / statistics.median(baseline_samples) - 1
+    if slowdown <= threshold:
+        return None
+    p = _mann_whitney_greater(result.samples, baseline_samples)
+    return Regression(result.name, slowdown, p) if p < alpha else None
+
+
+def check_baseline(results: Iterable[BenchResult], f: Path, threshold: float = 0.05, alpha: float = 0.01) -> list[Regression]:
+    """regressions against the baseline file; results without a baseline are skipped"""
+    data = _load(f)
+    out = []
+    for r in results:
+        if r.name not in data:
+            continue
+        reg = compare(r, data[r.name]["samples"], threshold, alpha)
+        if reg is not None:
+            out.append(reg)
+    return out
+
+
+def assert_no_regression(results: Iterable[BenchResult], f: Path, threshold: float = 0.05, alpha: float = 0.01):
+    regressions = check_baseline(results, f, threshold, alpha)
+    assert not regressions, "\n".join(map(str, regressions))
@@ -1,47 +1,396 @@
 from argparse import ArgumentParser
-import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import os
 from pathlib import Path
-from typing import Any, Generator
+import re
+import subprocess
+from typing import Any, Generator, Iterable, NamedTuple
 
 
 GIT = ".git"
 T = "t"
 F = "f"
+TABLE = "table"
+JSON = "json"
+# never worth descending into, add more with -p
+DEFAULT_PRUNE = ("node_modules", "venv", ".venv", "__pycache__", ".tox", ".mypy_cache")
+DEFAULT_CACHE = Path.home() / ".cache" / "find_repo.json"
 
 
-def _rec_traverse_dirs(start: Path) -> Generator[Path | Any, Any, None]:
-    for p in start.iterdir():
-        if p.is_file():
+def _scandir(d: str) -> list[os.DirEntry]:
+    try:
+        with os.scandir(d) as it:
+            return list(it)
+    except OSError:  # permissions, vanished dirs, ...
+        return []
+
+
+def _list_dir(d: str, prune: frozenset[str], follow_symlinks: bool) -> tuple[bool, list[str]]:
+    """does 'd' hold a '.git' entry, and the names of the subdirs worth visiting"""
+    is_repo = False
+    subdirs = []
+    for e in _scandir(d):
+        if e.name == GIT:
+            is_repo = True
             continue
-        else:
-            yield p
-            yield from _rec_traverse_dirs(p)
+        if e.name in prune:
+            continue
+        try:
+            if e.is_dir(follow_symlinks=follow_symlinks):
+                subdirs.append(e.name)
+        except OSError:
+            continue
+    return is_repo, subdirs
+
+
+class _DirCache:
+    """
+    persistent dir -> (mtime, is repo, subdirs) map
+
+    a dir mtime changes whenever an entry is added, removed or renamed in
+    it, so an unchanged mtime means the cached listing is still valid and
+    the dir does not need to be listed again (its subdirs are still checked)
+
+    saving merges into the stored entry: a depth-limited or interrupted walk
+    only updates what it visited, dirs are dropped only once seen to be gone
+    """
+
+    def __init__(self, f: Path, key: str, refresh: bool) -> None:
+        self.f = f
+        self.key = key
+        self.old: dict[str, list] = {} if refresh else self._load().get(key, {})
+        self.new: dict[str, list] = {}
+        self.gone: set[str] = set()
+
+    def _load(self) -> dict[str, dict[str, list]]:
+        try:
+            with self.f.open() as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, d: str, mtime: int) -> tuple[bool, list[str]] | None:
+        entry = self.old.get(d)
+        if entry is None or entry[0] != mtime:
+            return None
+        self.new[d] = entry
+        return entry[1], entry[2]
+
+    def put(self, d: str, mtime: int, listing: tuple[bool, list[str]]):
+        old = self.old.get(d)
+        if old is not None:
+            self.gone.update(os.path.join(d, s) for s in set(old[2]) - set(listing[1]))
+        self.new[d] = [mtime, listing[0], listing[1]]
+
+    def forget(self, d: str):
+        self.gone.add(d)
+
+    def _is_gone(self, d: str) -> bool:
+        return any(d == g or d.startswith(g + os.sep) for g in self.gone)
+
+    def save(self):
+        data = self._load()
+        entry = data.get(self.key, {})
+        if self.gone:
+            entry = {d: v for d, v in entry.items() if not self._is_gone(d)}
+        entry.update(self.new)
+        data[self.key] = entry
+        self.f.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.f.with_name(self.f.name + ".tmp")
+        with tmp.open("w") as fp:
+            json.dump(data, fp)
+        os.replace(tmp, self.f)
+
+
+def _walk_repos(
+    root            : Path,
+    prune           : frozenset[str] = frozenset(DEFAULT_PRUNE),
+    max_depth       : int | None = None,
+    follow_symlinks : bool = False,
+    cache           : _DirCache | None = None,
+) -> Generator[Path, Any, None]:
+    """
+    iterative DFS yielding the dirs that hold a '.git' entry
+
+    '.git' can be a dir or a file (worktrees, submodules), either way it is
+    never descended into. the rest of the repo is, to find nested repos
+    """
+    seen: set[tuple[int, int]] = set()
+    stack = [(str(root), 0)]
+    try:
+        while stack:
+            d, depth = stack.pop()
+            listing = None
+            if follow_symlinks or cache is not None:
+                try:
+                    st = os.stat(d)
+                except OSError:
+                    if cache is not None:
+                        cache.forget(d)
+                    continue
+                if follow_symlinks:
+                    if (st.st_dev, st.st_ino) in seen:  # symlink loop
+                        continue
+                    seen.add((st.st_dev, st.st_ino))
+                if cache is not None:
+                    listing = cache.get(d, st.st_mtime_ns)
+            if listing is None:
+                listing = _list_dir(d, prune, follow_symlinks)
+                if cache is not None:
+                    cache.put(d, st.st_mtime_ns, listing)
+            is_repo, subdirs = listing
+            if is_repo:
+                yield Path(d)
+            if max_depth is None or depth < max_depth:
+                stack.extend((os.path.join(d, s), depth + 1) for s in reversed(subdirs))
+    finally:
+        if cache is not None:
+            cache.save()
 
 
-def _find_git_dirs(root: Path, _abs: bool) -> Generator[str, Any, None]:
-    fs = _rec_traverse_dirs(root)
-    fs = (f for f in fs if GIT in f.parts)
+def _find_git_dirs(
+    root            : Path,
+    _abs            : bool,
+    prune           : frozenset[str] = frozenset(DEFAULT_PRUNE),
+    max_depth       : int | None = None,
+    follow_symlinks : bool = False,
+    cache_file      : Path | None = None,
+    refresh         : bool = False,
+) -> Generator[str, Any, None]:
+    cache = None
+    if cache_file is not None:
+        key = f"{root.resolve()}|{','.join(sorted(prune))}|{int(follow_symlinks)}"
+        cache = _DirCache(cache_file, key, refresh)
+    fs = _walk_repos(root, prune, max_depth, follow_symlinks, cache)
     if _abs:
         fs = (f.resolve() for f in fs)
-    fs = map(str, fs)
-    fs = (f.split(GIT)[0] for f in fs)
-    fs = (f for f, _ in itertools.groupby(fs))
-    yield from fs
+    yield from map(str, fs)
+
+
+# =============================================================================
+# status, read straight from the .git files where possible
+
+RE_CONFIG_SECTION = re.compile(r'^\s*\[\s*([^\s\]"]+)(?:\s+"(.*)")?\s*\]')
+RE_CONFIG_KEY = re.compile(r"^\s*([A-Za-z][\w-]*)\s*=\s*(.*?)\s*$")
+
+
+class RepoStatus(NamedTuple):
+    path   : str
+    branch : str | None  # None when HEAD is detached
+    head   : str | None  # None on a repo without commits
+    dirty  : bool | None # None when git could not be run
+    ahead  : int | None  # None without an upstream
+    behind : int | None
+
+    def to_json(self) -> str:
+        return json.dumps(self._asdict())
+
+    def to_row(self) -> str:
+        def show(x):
+            return "-" if x is None else str(x)
+        dirty = "-" if self.dirty is None else ("dirty" if self.dirty else "clean")
+        return (
+            f"{show(self.branch):<24} {(self.head or '-')[:10]:<10} {dirty:<5} "
+            f"{show(self.ahead):>5} {show(self.behind):>6}  {self.path}"
+        )
+
+    @staticmethod
+    def header() -> str:
+        return f"{'branch':<24} {'head':<10} {'state':<5} {'ahead':>5} {'behind':>6}  path"
+
+
+def _git_dir(repo: Path) -> Path | None:
+    """the real git dir, following the 'gitdir: ...' file of worktrees and submodules"""
+    dot_git = repo / GIT
+    if dot_git.is_dir():
+        return dot_git
+    try:
+        content = dot_git.read_text().strip()
+    except OSError:
+        return None
+    if not content.startswith("gitdir:"):
+        return None
+    return (repo / content[len("gitdir:"):].strip()).resolve()
+
+
+def _common_dir(git_dir: Path) -> Path:
+    """where refs and config live, differs from the git dir for linked worktrees"""
+    try:
+        return (git_dir / (git_dir / "commondir").read_text().strip()).resolve()
+    except OSError:
+        return git_dir
+
+
+def _packed_refs(common: Path) -> dict[str, str]:
+    out = {}
+    try:
+        with (common / "packed-refs").open() as fp:
+            for line in fp:
+                if line.startswith(("#", "^")):
+                    continue
+                sha, _, ref = line.strip().partition(" ")
+                out[ref] = sha
+    except OSError:
+        pass
+    return out
+
+
+def _read_ref(git_dir: Path, common: Path, ref: str, packed: dict[str, str], hops: int = 5) -> str | None:
+    for base in (git_dir, common):
+        try:
+            content = (base / ref).read_text().strip()
+        except OSError:
+            continue
+        if content.startswith("ref:") and hops > 0:
+            return _read_ref(git_dir, common, content[4:].strip(), packed, hops - 1)
+        return content
+    return packed.get(ref)
+
+
+def _upstream_ref(common: Path, branch: str) -> str | None:
+    """refs/remotes/<remote>/<branch> from the [branch "..."] section of the config"""
+    remote = merge = None
+    section = None
+    try:
+        lines = (common / "config").read_text().splitlines()
+    except OSError:
+        return None
+    for line in lines:
+        m = RE_CONFIG_SECTION.match(line)
+        if m:
+            section = (m.group(1).lower(), m.group(2))
+            continue
+        m = RE_CONFIG_KEY.match(line)
+        if m and section == ("branch", branch):
+            key = m.group(1).lower()
+            if key == "remote":
+                remote = m.group(2)
+            elif key == "merge":
+                merge = m.group(2)
+    if remote is None or merge is None:
+        return None
+    if remote == ".":
+        return merge
+    return f"refs/remotes/{remote}/{merge.removeprefix('refs/heads/')}"
+
+
+def _git(repo: Path, *args: str) -> str | None:
+    try:
+        res = subprocess.run(
+            ["git", "-C", str(repo), *args],
+            capture_output=True, text=True, timeout=60
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return res.stdout if res.returncode == 0 else None
+
 
+def repo_status(repo: Path) -> RepoStatus:
+    """
+    branch, HEAD and upstream come from the files under .git, git itself is
+    run for the dirty flag and only when HEAD and upstream differ for the
+    ahead/behind counts
+    """
+    git_dir = _git_dir(repo)
+    if git_dir is None:
+        return RepoStatus(str(repo), None, None, None, None, None)
+    common = _common_dir(git_dir)
+    packed = _packed_refs(common)
+    branch = head = None
+    try:
+        content = (git_dir / "HEAD").read_text().strip()
+    except OSError:
+        content = ""
+    if content.startswith("ref:"):
+        ref = content[4:].strip()
+        branch = ref.removeprefix("refs/heads/")
+        head = _read_ref(git_dir, common, ref, packed)
+    elif content:
+        head = content
 
-def _parse_args() -> tuple[Path, bool] | None:
+    ahead = behind = None
+    upstream = None if branch is None else _upstream_ref(common, branch)
+    up_sha = None if upstream is None else _read_ref(git_dir, common, upstream, packed)
+    if head is not None and up_sha is not None:
+        if up_sha == head:
+            ahead = behind = 0
+        else:
+            counts = _git(repo, "rev-list", "--left-right", "--count", f"HEAD...{upstream}")
+            if counts:
+                ahead, behind = map(int, counts.split())
+
+    porcelain = _git(repo, "status", "--porcelain", "--untracked-files=no")
+    dirty = None if porcelain is None else bool(porcelain.strip())
+    return RepoStatus(str(repo), branch, head, dirty, ahead, behind)
+
+
+def _stream_status(repos: Iterable[Path], workers: int) -> Generator[RepoStatus, Any, None]:
+    """statuses in completion order, the walk keeps going while git runs"""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for repo in repos:
+            pending.add(pool.submit(repo_status, repo))
+            done = {f for f in pending if f.done()}
+            pending -= done
+            for f in done:
+                yield f.result()
+        for f in as_completed(pending):
+            yield f.result()
+
+
+class _Args(NamedTuple):
+    root            : Path
+    absolute        : bool
+    prune           : frozenset[str]
+    max_depth       : int | None
+    follow_symlinks : bool
+    status          : bool
+    fmt             : str
+    workers         : int
+    cache_file      : Path | None
+    refresh         : bool
+
+
+def _parse_args() -> _Args | None:
     parser = ArgumentParser(
         prog=f"python3 {Path(__file__).name}",
         description="find .git directories",
     )
     parser.add_argument(
-        "root_dir", 
+        "root_dir",
         help="root dir from which the recursive search starts"
     )
     parser.add_argument(
         "-a", help=f"represent dirs as absolute paths. defaults to {T} for true",
         choices=(T, F), type=str, default=T
     )
+    parser.add_argument(
+        "-p", help=f"dir name to skip, can be repeated. always skipped: {', '.join(DEFAULT_PRUNE)}",
+        action="append", default=[]
+    )
+    parser.add_argument(
+        "-d", help="max depth below the root dir", type=int, default=None
+    )
+    parser.add_argument(
+        "-L", help="follow symlinks (loops are detected)", action="store_true"
+    )
+    parser.add_argument(
+        "-s", help="report branch, HEAD, dirty flag and ahead/behind of each repo", action="store_true"
+    )
+    parser.add_argument(
+        "-f", help="output format of -s", choices=(TABLE, JSON), default=TABLE
+    )
+    parser.add_argument(
+        "-j", help="git processes running at the same time for -s", type=int, default=16
+    )
+    parser.add_argument(
+        "-c", help=f"cache the walk in this file, only changed dirs get listed again. defaults to {DEFAULT_CACHE}",
+        nargs="?", const=DEFAULT_CACHE, default=None, type=Path
+    )
+    parser.add_argument(
+        "--refresh", help="ignore the cached walk (it is still rewritten)", action="store_true"
+    )
     parsed = parser.parse_args()
     root = Path(parsed.root_dir)
     if not root.exists():
@@ -50,19 +399,31 @@ def _parse_args() -> tuple[Path, bool] | None:
     if not root.is_dir():
         print(f"is not a directory: {root}")
         return None
-    return root, (parsed.a == T)
+    prune = frozenset(DEFAULT_PRUNE) | frozenset(parsed.p)
+    return _Args(
+        root, (parsed.a == T), prune, parsed.d, parsed.L, parsed.s, parsed.f, max(1, parsed.j),
+        parsed.c, parsed.refresh
+    )
 
 
 def main() -> int:
     args = _parse_args()
     if args is None:
         return 1
-    fs = _find_git_dirs(args[0], args[1])
-    for f in fs:
-        print(f)
+    fs = _find_git_dirs(
+        args.root, args.absolute, args.prune, args.max_depth, args.follow_symlinks,
+        args.cache_file, args.refresh
+    )
+    if not args.status:
+        for f in fs:
+            print(f)
+        return 0
+    if args.fmt == TABLE:
+        print(RepoStatus.header())
+    for st in _stream_status(map(Path, fs), args.workers):
+        print(st.to_json() if args.fmt == JSON else st.to_row(), flush=True)
     return 0
 
 
 if __name__ == "__main__":
     main()
-
@@ -4,10 +4,343 @@ because at work I can't install cool linux stuff
 """
 
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import locale
+import mmap
+import os
 from pathlib import Path
 import re
+import sqlite3
+import sys
 import typing as ty
 
+try:
+    from re import _parser
+except ImportError:  # python < 3.11
+    import sre_parse as _parser
+
+
+BATCH = 32  # files per task in parallel mode
+SNIFF = 8192  # a NUL byte in the first block means binary file
+# both engines decode with it, so the output does not depend on the engine
+ENCODING = locale.getpreferredencoding(False)
+ALWAYS_SKIP = frozenset((".git", ".hg", ".svn"))
+
+Match = tuple[int, str]  # line number, line
+
+
+def _is_binary(head: bytes) -> bool:
+    return b"\0" in head[:SNIFF]
+
+
+def _parse_size(s: str) -> int:
+    """'500', '64K', '10M', '1G' -> bytes"""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    s = s.strip().upper()
+    if s and s[-1] in units:
+        return int(float(s[:-1]) * units[s[-1]])
+    return int(s)
+
+# =============================================================================
+# .gitignore
+
+def _glob_to_regex(pat: str) -> str:
+    """gitignore glob -> regex, '*' and '?' do not cross '/', '**' does"""
+    out = []
+    i = 0
+    while i < len(pat):
+        c = pat[i]
+        if pat.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pat.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = pat.find("]", i + 1)
+            if j < 0:
+                out.append(re.escape(c))
+            else:
+                body = pat[i+1:j].replace("\\", "\\\\")
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = j
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+class _IgnoreRule(ty.NamedTuple):
+    base     : str         # dir holding the .gitignore
+    regex    : re.Pattern
+    negate   : bool
+    dir_only : bool
+    anchored : bool        # matched against the path relative to 'base', not the name
+
+    @classmethod
+    def parse(cls, base: str, line: str) -> "_IgnoreRule | None":
+        line = line.rstrip("\n").rstrip()
+        if not line or line.startswith("#"):
+            return None
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        anchored = "/" in line
+        line = line.lstrip("/")
+        if not line:
+            return None
+        return cls(base, re.compile(_glob_to_regex(line) + "$"), negate, dir_only, anchored)
+
+    def matches(self, path: str, name: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        if self.anchored:
+            rel = os.path.relpath(path, self.base).replace(os.sep, "/")
+            return self.regex.match(rel) is not None
+        return self.regex.match(name) is not None
+
+
+def _read_gitignore(d: str) -> list[_IgnoreRule]:
+    try:
+        with open(os.path.join(d, ".gitignore"), encoding="utf-8", errors="replace") as fp:
+            rules = (_IgnoreRule.parse(d, line) for line in fp)
+            return [r for r in rules if r is not None]
+    except OSError:
+        return []
+
+
+def _ignored(rules: tuple[_IgnoreRule, ...], path: str, name: str, is_dir: bool) -> bool:
+    out = False
+    for rule in rules:  # the last matching rule wins
+        if rule.matches(path, name, is_dir):
+            out = not rule.negate
+    return out
+
+
+def _bytes_safe(items) -> bool:
+    """
+    True when matching the parsed pattern on utf-8 bytes gives the same lines
+    as on text. categories (\\w, \\d, ...), negated sets, word boundaries
+    and most anchors are ascii-only or string-based on bytes; a lone '.' is
+    one byte, not one character, so it is only accepted in open-ended
+    repeats like .* and .+
+    """
+    possessive = getattr(_parser, "POSSESSIVE_REPEAT", None)
+    for op, av in items:
+        if op is _parser.LITERAL or op is _parser.GROUPREF:
+            continue
+        if op is _parser.AT:
+            if av is not _parser.AT_BEGINNING:
+                return False
+        elif op is _parser.IN:
+            # plain ascii sets like [a-z_] or x|y
+            if any(o is not _parser.LITERAL and o is not _parser.RANGE for o, _ in av):
+                return False
+        elif op is _parser.SUBPATTERN:
+            _, add_flags, _, sub = av
+            if add_flags & re.I or not _bytes_safe(sub):
+                return False
+        elif op is _parser.BRANCH:
+            if not all(_bytes_safe(sub) for sub in av[1]):
+                return False
+        elif op in (_parser.MAX_REPEAT, _parser.MIN_REPEAT, possessive):
+            lo, hi, sub = av
+            sub = list(sub)
+            if len(sub) == 1 and sub[0][0] is _parser.ANY:
+                if lo > 1 or hi is not _parser.MAXREPEAT:
+                    return False
+            elif not _bytes_safe(sub):
+                return False
+        else:  # ANY, IN, CATEGORY, NOT_LITERAL, lookarounds, ...
+            return False
+    return True
+
+
+def _ascii_compatible(encoding: str) -> bool:
+    """ascii text is the same bytes (utf-8, cp1252, latin-1, ... but not utf-16)"""
+    sample = "azAZ09 _.\r\n"
+    try:
+        return sample.encode(encoding) == sample.encode("ascii")
+    except (LookupError, UnicodeError):
+        return False
+
+
+def _bytes_expr(expr: re.Pattern) -> re.Pattern | None:
+    """
+    the bytes version of 'expr' for the mmap engine, None if the pattern
+    could match different lines on bytes (see _bytes_safe)
+
+    MULTILINE lets '^' match at line boundaries of the whole buffer
+    """
+    if not expr.pattern.isascii() or expr.flags & re.I or not _ascii_compatible(ENCODING):
+        return None
+    try:
+        parsed = _parser.parse(expr.pattern, expr.flags)
+    except re.error:
+        return None
+    if parsed.state.flags & re.I or not _bytes_safe(parsed):
+        return None
+    return re.compile(expr.pattern.encode(), re.M)
+
+
+def _literal_runs(expr: re.Pattern) -> list[bytes]:
+    """the runs of plain characters that every match must contain (case as written)"""
+    if not expr.pattern.isascii():
+        return []
+    try:
+        parsed = _parser.parse(expr.pattern, expr.flags & ~re.U)
+    except re.error:
+        return []
+    runs = []
+    cur = b""
+    for op, av in parsed:
+        if op is _parser.LITERAL:
+            cur += bytes((av,))
+        elif cur:
+            runs.append(cur)
+            cur = b""
+    if cur:
+        runs.append(cur)
+    return runs
+
+
+def _required_literal(expr: re.Pattern) -> bytes | None:
+    """the longest run of plain characters that every match must contain"""
+    if expr.flags & re.I:
+        return None
+    return max(_literal_runs(expr), key=len, default=None)
+
+# =============================================================================
+# trigram index
+
+def _trigrams(data: bytes) -> set[int]:
+    data = data.lower()  # one index serves both case sensitive and insensitive searches
+    return {int.from_bytes(data[i:i+3], "big") for i in range(len(data) - 2)}
+
+
+def _dir_prefix(root: Path) -> str:
+    r = str(root)
+    return r if r.endswith(os.sep) else r + os.sep
+
+
+def _is_under(path: str, root: Path) -> bool:
+    """'path' is 'root' itself or inside it, /x/foobar is not under /x/foo"""
+    return path == str(root) or path.startswith(_dir_prefix(root))
+
+
+# paths equal to root or in the [root/, root/\uffff) range
+_UNDER = "(f.path = ? OR (f.path >= ? AND f.path < ?))"
+
+
+def _under_params(root: Path) -> tuple[str, str, str]:
+    prefix = _dir_prefix(root)
+    return str(root), prefix, prefix + "\uffff"
+
+
+class TrigramIndex:
+    """
+    sqlite file mapping each trigram to the files that contain it
+
+    refreshed incrementally (only files whose mtime or size changed are read
+    again), queried with the trigrams of the literals the regex requires
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            id    INTEGER PRIMARY KEY,
+            path  TEXT UNIQUE NOT NULL,
+            mtime INTEGER NOT NULL,
+            size  INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS postings (
+            tri  INTEGER NOT NULL,
+            file INTEGER NOT NULL,
+            PRIMARY KEY (tri, file)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS postings_file ON postings (file);
+    """
+
+    def __init__(self, db: Path) -> None:
+        self.conn = sqlite3.connect(db)
+        self.conn.executescript(self.SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _forget(self, file_id: int):
+        self.conn.execute("DELETE FROM postings WHERE file = ?", (file_id,))
+        self.conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    def update(self, root: Path, files: ty.Iterable[Path]):
+        """(re)index the changed files, drop the vanished ones under 'root'"""
+        known = {
+            p: (i, m, s)
+            for i, p, m, s in self.conn.execute("SELECT id, path, mtime, size FROM files")
+            if _is_under(p, root)
+        }
+        with self.conn:
+            for f in files:
+                key = str(f)
+                try:
+                    st = f.stat()
+                    old = known.pop(key, None)
+                    if old is not None:
+                        if old[1:] == (st.st_mtime_ns, st.st_size):
+                            continue
+                        self._forget(old[0])
+                    data = f.read_bytes()
+                    tris = set() if _is_binary(data) else _trigrams(data)
+                except OSError:
+                    continue
+                cur = self.conn.execute(
+                    "INSERT INTO files (path, mtime, size) VALUES (?, ?, ?)",
+                    (key, st.st_mtime_ns, st.st_size)
+                )
+                self.conn.executemany(
+                    "INSERT INTO postings (tri, file) VALUES (?, ?)",
+                    ((t, cur.lastrowid) for t in tris)
+                )
+            for file_id, _, _ in known.values():
+                self._forget(file_id)
+
+    def candidates(self, root: Path, literals: list[bytes]) -> list[Path] | None:
+        """indexed files under 'root' that contain every literal, None when the literals are too short"""
+        tris = set()
+        for lit in literals:
+            tris |= _trigrams(lit)
+        if not tris:
+            return None
+        marks = ", ".join("?" * len(tris))
+        rows = self.conn.execute(
+            f"""
+            SELECT f.path FROM postings p JOIN files f ON f.id = p.file
+            WHERE p.tri IN ({marks}) AND {_UNDER}
+            GROUP BY p.file HAVING COUNT(*) = ?
+            ORDER BY f.path
+            """,
+            (*tris, *_under_params(root), len(tris))
+        )
+        return [Path(p) for p, in rows]
+
+    def files(self, root: Path) -> list[Path]:
+        rows = self.conn.execute(
+            f"SELECT f.path FROM files f WHERE {_UNDER} ORDER BY f.path",
+            _under_params(root)
+        )
+        return [Path(p) for p, in rows]
+
 
 class Args(ty.NamedTuple):
     expr : re.Pattern
@@ -15,6 +348,17 @@ class Args(ty.NamedTuple):
     r    : bool
     i    : bool
     n    : bool
+    j    : int
+    bexpr   : re.Pattern | None = None  # mmap engine, see _bytes_expr
+    literal : bytes | None = None       # prefilter for the mmap engine
+    index   : Path | None = None        # trigram index file
+    refresh : bool = True               # update the index before searching
+    l        : bool = False             # only the names of the files with matches
+    c        : bool = False             # only the count of matching lines
+    m        : int | None = None        # stop a file after m matching lines
+    q        : bool = False             # no output, stop at the first match
+    max_size : int | None = None        # skip bigger files
+    ignore   : bool = True              # honour .gitignore files
 
     @classmethod
     def from_cli(cls):
@@ -27,6 +371,15 @@ class Args(ty.NamedTuple):
         parser.add_argument("-r",   help="recursively traverse dirs",               required=False, action="store_true")
         parser.add_argument("-i",   help="insensitive case",                        required=False, action="store_true")
         parser.add_argument("-n",   help="print file and line number of the match", required=False, action="store_true")
+        parser.add_argument("-j",   help="search files with N processes",           required=False, type=int, default=1)
+        parser.add_argument("--index",      help="trigram index file, built/updated on the fly", required=False, default=None)
+        parser.add_argument("--no-refresh", help="trust the index as is, skip the update",     required=False, action="store_true")
+        parser.add_argument("-l",   help="print only the names of files with matches",  required=False, action="store_true")
+        parser.add_argument("-c",   help="print only the count of matches per file",    required=False, action="store_true")
+        parser.add_argument("-m",   help="stop reading a file after N matching lines",  required=False, type=int, default=None)
+        parser.add_argument("-q",   help="quiet, exit status 0 on the first match",     required=False, action="store_true")
+        parser.add_argument("--max-size",  help="skip files bigger than this (e.g. 500K, 10M)", required=False, type=_parse_size, default=None)
+        parser.add_argument("--no-ignore", help="do not honour .gitignore files",             required=False, action="store_true")
         parsed = parser.parse_args()
         path = Path(parsed.path)
         if not path.exists():
@@ -35,41 +388,219 @@ class Args(ty.NamedTuple):
             expr = re.compile(parsed.expr, re.I)
         else:
             expr = re.compile(parsed.expr)
-        return cls(expr, path, parsed.r, parsed.i, parsed.n)
+        index = None if parsed.index is None else Path(parsed.index).absolute()
+        return cls(
+            expr, path, parsed.r, parsed.i, parsed.n, max(1, parsed.j),
+            _bytes_expr(expr), _required_literal(expr), index, not parsed.no_refresh,
+            parsed.l, parsed.c, parsed.m, parsed.q, parsed.max_size, not parsed.no_ignore
+        )
+
+    def matches_lines(self, f: Path) -> ty.Generator[Match, None, None]:
+        """line engine: decode and check one line at a time"""
+        with f.open("rb") as fp:
+            if _is_binary(fp.read(SNIFF)):
+                return
+        with f.open("r", encoding=ENCODING) as fp:
+            for i, line in enumerate(fp, start=1):
+                line = line.strip("\n")
+                if self.expr.search(line):
+                    yield i, line
+
+    def matches_mmap(self, f: Path) -> ty.Generator[Match, None, None]:
+        """
+        fast engine: runs the bytes regex over the memory-mapped file
 
-    def do_one_file(self, f: Path):
-        with f.open("r") as fp:
+        candidates come from bytes.find on the required literal (or from the
+        regex itself), only then the surrounding line is located, checked
+        and decoded
+        """
+        with f.open("rb") as fp:
             try:
-                for i, line in enumerate(fp, start=1):
-                    line = line.strip("\n")
-                    match = re.findall(self.expr, line)
-                    if not match:
-                        continue
-                    if self.n:
-                        print(f, i, line, sep=": ")
-                    else:
-                        print(line)
-            except UnicodeDecodeError:
-                print(f"UnicodeDecodeError on file: {f}")
+                buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
                 return
+        with buf:
+            if _is_binary(buf[:SNIFF]):
+                return
+            end = len(buf)
+            pos = 0
+            lineno, counted = 1, 0
+            while pos < end:
+                if self.literal is not None:
+                    hit = buf.find(self.literal, pos)
+                    if hit < 0:
+                        break
+                else:
+                    m = self.bexpr.search(buf, pos)
+                    if m is None:
+                        break
+                    hit = m.start()
+                start = max(buf.rfind(b"\n", pos, hit) + 1, pos)
+                stop = buf.find(b"\n", hit)
+                if stop < 0:
+                    stop = end
+                # text mode turns \r\n into \n, the line is checked without the \r
+                eol = stop - 1 if stop > start and buf[stop - 1] == 13 else stop
+                if self.bexpr.search(buf, start, eol):
+                    lineno += buf[counted:start].count(b"\n")
+                    counted = start
+                    # like the line engine: same codec, UnicodeDecodeError on bad bytes
+                    yield lineno, buf[start:stop].rstrip(b"\r").decode(ENCODING)
+                pos = stop + 1
 
-    def traverse_filesys(self, f: Path):
-        if not f.exists():
-            return
+    def matches(self, f: Path) -> ty.Iterator[Match]:
+        """lazy matches of a single file, stops after -m matches"""
+        it = self.matches_mmap(f) if self.bexpr is not None else self.matches_lines(f)
+        return it if self.m is None else itertools.islice(it, self.m)
+
+    def search_file(self, f: Path) -> list[str]:
+        """
+        the output lines for a single file
+
+        -q and -l stop reading at the first match, -m after m matches
+        """
+        out: list[str] = []
+        count = 0
+        try:
+            for i, line in self.matches(f):
+                count += 1
+                if self.q or self.l:
+                    return [str(f)]
+                if not self.c:
+                    out.append(f"{f}: {i}: {line}" if self.n else line)
+        except UnicodeDecodeError:
+            # what matched before the bad bytes is kept
+            if self.c and count:
+                out.append(f"{f}: {count}")
+            out.append(f"UnicodeDecodeError on file: {f}")
+            return out
+        if self.c:
+            return [f"{f}: {count}"] if count else []
+        return out
+
+    def search_files(self, fs: list[Path]) -> list[list[str]]:
+        return [self.search_file(f) for f in fs]
+
+    def do_one_file(self, f: Path) -> bool:
+        lines = self.search_file(f)
+        if not self.q:
+            for line in lines:
+                print(line)
+        return bool(lines)
+
+    def walk_files(self, f: Path) -> ty.Generator[Path, None, None]:
+        """
+        DFS over the files under 'f', without recursion
+
+        os.scandir entries cache the file type, so this is mostly one stat
+        per file; vcs folders and .gitignore'd paths are pruned on the way
+        """
         if f.is_file():
-            self.do_one_file(f)
-        elif f.is_dir():
-            for fp in f.iterdir():
-                self.traverse_filesys(fp)
+            yield f
+            return
+        if not f.is_dir():
+            return
+        root = str(f)
+        rules = tuple(_read_gitignore(root)) if self.ignore else ()
+        stack = [(iter(_scandir(root)), rules)]
+        while stack:
+            entries, rules = stack[-1]
+            e = next(entries, None)
+            if e is None:
+                stack.pop()
+                continue
+            try:
+                is_dir = e.is_dir()
+                if self.ignore and (
+                    (is_dir and e.name in ALWAYS_SKIP) or _ignored(rules, e.path, e.name, is_dir)
+                ):
+                    continue
+                if is_dir:
+                    sub = rules + tuple(_read_gitignore(e.path)) if self.ignore else ()
+                    stack.append((iter(_scandir(e.path)), sub))
+                elif e.is_file():
+                    if self.max_size is not None and e.stat().st_size > self.max_size:
+                        continue
+                    yield Path(e.path)
+            except OSError:
+                continue
+
+    def indexed_files(self, f: Path) -> list[Path]:
+        """the files under 'f' that may match, according to the trigram index"""
+        idx = TrigramIndex(self.index)
+        try:
+            if self.refresh:
+                idx.update(f, (fp for fp in self.walk_files(f) if fp != self.index))
+            files = idx.candidates(f, _literal_runs(self.expr))
+            return idx.files(f) if files is None else files
+        finally:
+            idx.close()
+
+    def traverse_filesys(self, f: Path) -> bool:
+        """search everything under 'f', True if anything matched"""
+        if not f.exists():
+            return False
+        if self.index is not None:
+            files = self.indexed_files(f)
+        else:
+            files = self.walk_files(f)
+        if self.j > 1:
+            return self.traverse_parallel(files)
+        found = False
+        for fp in files:
+            found = self.do_one_file(fp) or found
+            if found and self.q:
+                break
+        return found
+
+    def traverse_parallel(self, files: ty.Iterable[Path]) -> bool:
+        """
+        the walk feeds batches of files to a process pool, the output is
+        printed in walk order and one whole file at a time
+        """
+        files = iter(files)
+        batches = iter(lambda: list(itertools.islice(files, BATCH)), [])
+        found = False
+        with ProcessPoolExecutor(max_workers=self.j) as pool:
+            pending = deque()
+            for batch in batches:
+                pending.append(pool.submit(self.search_files, batch))
+                if len(pending) >= 2 * self.j:
+                    found = self._print_batch(pending.popleft().result()) or found
+                    if found and self.q:
+                        break
+            while pending and not (found and self.q):
+                found = self._print_batch(pending.popleft().result()) or found
+            for fut in pending:
+                fut.cancel()
+        return found
+
+    def _print_batch(self, results: list[list[str]]) -> bool:
+        found = False
+        for lines in results:
+            if lines:
+                found = True
+                if not self.q:
+                    print("\n".join(lines))
+        return found
+
+
+def _scandir(d: str) -> list[os.DirEntry]:
+    try:
+        with os.scandir(d) as it:
+            return list(it)
+    except OSError:
+        return []
 
 
-def main():
+def main() -> int:
+    """grep-like exit status: 0 if something matched, 1 otherwise"""
     args = Args.from_cli()
     if args is None:
-        return
-    args.traverse_filesys(args.path.absolute())
+        return 2
+    return 0 if args.traverse_filesys(args.path.absolute()) else 1
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
 
@@ -2,9 +2,20 @@
 simple date manipulation. 
 
 works on pandas.TimeStamp as well
+
+the vec_ functions are the array versions of the scalar ones, for numpy
+datetime64 arrays and pandas Series (numpy needed)
 """
 
+from array import array
 from datetime import date, timedelta
+import functools
+from typing import Iterable, Iterator
+
+try:
+    import numpy as np
+except ImportError:  # the scalar helpers only need the standard library
+    np = None
 
 
 ONE_DAY = timedelta(days=1)
@@ -37,39 +48,47 @@ def next_week(d: date) -> date:
 
 
 def prev_month(d: date) -> date:
-    if d.month == 1:
-        return d.replace(year=d.year-1, month=12)
-    for i in range(4):
-        try:
-            return d.replace(month=d.month-1, day=d.day-i)
-        except ValueError:
-            continue
-    raise Exception("unrechable")
+    return add_months(d, -1)
 
 
 def next_month(d: date) -> date:
-    if d.month == 12:
-        return d.replace(year=d.year+1, month=1)
-    for i in range(4):
-        try:
-            return d.replace(month=d.month+1, day=d.day-i)
-        except ValueError:
-            continue
-    raise Exception("unrechable")
+    return add_months(d, 1)
 
 
 def prev_year(d: date) -> date:
-    try:
-        return d.replace(year=d.year-1)
-    except ValueError:
-        return d.replace(year=d.year-1, day=d.day-1)
+    return add_months(d, -12)
 
 
 def next_year(d: date) -> date:
-    try:
-        return d.replace(year=d.year+1)
-    except ValueError:
-        return d.replace(year=d.year+1, day=d.day-1)
+    return add_months(d, 12)
+
+
+def is_leap_year(year: int) -> bool:
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+_DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def days_in_month(year: int, month: int) -> int:
+    if month == 2 and is_leap_year(year):
+        return 29
+    return _DAYS_IN_MONTH[month - 1]
+
+
+def add_months(d: date, n: int) -> date:
+    """shift by 'n' months, the day is clamped to the end of the month"""
+    y, m = divmod(d.year * 12 + d.month - 1 + n, 12)
+    m += 1
+    return d.replace(year=y, month=m, day=min(d.day, days_in_month(y, m)))
+
+
+def add_quarters(d: date, n: int) -> date:
+    return add_months(d, 3 * n)
+
+
+def add_years(d: date, n: int) -> date:
+    return add_months(d, 12 * n)
 
 
 def quarter(d: date) -> int:
@@ -85,12 +104,7 @@ def start_of_month(d: date) -> date:
 
 
 def end_of_month(d: date) -> date:
-    for day in reversed(range(28, 32)):
-        try:
-            return d.replace(day=day)
-        except ValueError:
-            continue
-    raise Exception("unrechable")
+    return d.replace(day=days_in_month(d.year, d.month))
 
 
 def start_of_year(d: date) -> date:
@@ -146,3 +160,376 @@ def previous_friday(d: date) -> date:
 def next_friday(d: date) -> date:
     offsets = (4, 3, 2, 1, 7, 6, 5)
     return d + (ONE_DAY * offsets[d.weekday()])
+
+
+# =============================================================================
+# schedules
+# lazy generators over [start, end], each element is computed directly
+
+def _months(start: date, end: date) -> Iterator[tuple[int, int]]:
+    y, m = start.year, start.month
+    while (y, m) <= (end.year, end.month):
+        yield y, m
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+
+
+def month_ends(start: date, end: date) -> Iterator[date]:
+    for y, m in _months(start, end):
+        d = date(y, m, days_in_month(y, m))
+        if start <= d <= end:
+            yield d
+
+
+def quarter_ends(start: date, end: date) -> Iterator[date]:
+    return (d for d in month_ends(start, end) if d.month % 3 == 0)
+
+
+def nth_weekday_of_month(start: date, end: date, weekday: int, n: int) -> Iterator[date]:
+    """
+    the n-th 'weekday' (WEEKDAY_MON, ...) of every month, counting from the
+    end when 'n' is negative (-1 is the last one). months without it (a 5th
+    friday) are skipped
+
+    nth_weekday_of_month(start, end, WEEKDAY_FRI, 3)  # options expiries
+    """
+    if n == 0 or not -5 <= n <= 5:
+        raise ValueError(f"n must be in 1..5 or -5..-1, got {n}")
+    if not 0 <= weekday < DAYS_IN_WEEK:
+        raise ValueError(f"weekday must be in 0..6 (WEEKDAY_MON..WEEKDAY_SUN), got {weekday}")
+    for y, m in _months(start, end):
+        last = days_in_month(y, m)
+        if n > 0:
+            first_wd = date(y, m, 1).weekday()
+            day = 1 + (weekday - first_wd) % DAYS_IN_WEEK + DAYS_IN_WEEK * (n - 1)
+        else:
+            last_wd = date(y, m, last).weekday()
+            day = last - (last_wd - weekday) % DAYS_IN_WEEK - DAYS_IN_WEEK * (-n - 1)
+        if 1 <= day <= last:
+            d = date(y, m, day)
+            if start <= d <= end:
+                yield d
+
+
+def business_days(start: date, end: date, holidays: Iterable[date] = ()) -> Iterator[date]:
+    """every monday to friday that is not in 'holidays'"""
+    off = set(holidays)
+    d = start if is_workday(start) else next_working_day(start)
+    while d <= end:
+        if d not in off:
+            yield d
+        d = next_working_day(d)
+
+# =============================================================================
+# business calendar
+
+FOLLOWING = "following"
+PRECEDING = "preceding"
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class BusinessCalendar:
+    """
+    business days between 'start' and 'end' (both included) for a weekmask
+    ("1111100" is monday to friday) and a list of holidays
+
+    a cumulative count of business days is precomputed once, so adding N
+    business days, counting them between two dates and rolling to the
+    nearest one are O(1) lookups. the vec_ methods do the same on numpy
+    datetime64 arrays / pandas Series. dates outside the range raise
+    ValueError
+
+    cal = BusinessCalendar(date(2000, 1, 1), date(2040, 12, 31), holidays)
+    settlement = cal.add(trade_date, 2)
+    """
+
+    def __init__(self, start: date, end: date, holidays: Iterable[date] = (), weekmask: str = "1111100") -> None:
+        if len(weekmask) != DAYS_IN_WEEK or set(weekmask) - {"0", "1"}:
+            raise ValueError(f"weekmask must be 7 chars of 0/1, got {weekmask!r}")
+        if end < start:
+            raise ValueError(f"empty range: {start} - {end}")
+        self.weekmask = weekmask
+        self._first = start.toordinal()
+        self._n = end.toordinal() - self._first + 1
+        off = {h.toordinal() for h in holidays}
+        # rank[i]: business days strictly before day i, bdays[k]: ordinal of the k-th business day
+        self._rank = array("q", bytes(8 * (self._n + 1)))
+        self._bdays = array("q")
+        count = 0
+        for i in range(self._n):
+            o = self._first + i
+            self._rank[i] = count
+            # ordinal 1 (0001-01-01) was a monday
+            if weekmask[(o - 1) % DAYS_IN_WEEK] == "1" and o not in off:
+                self._bdays.append(o)
+                count += 1
+        self._rank[self._n] = count
+        self._np = None
+
+    @property
+    def start(self) -> date:
+        return date.fromordinal(self._first)
+
+    @property
+    def end(self) -> date:
+        return date.fromordinal(self._first + self._n - 1)
+
+    def _idx(self, d: date, upto: int = 0) -> int:
+        i = d.toordinal() - self._first
+        if not 0 <= i < self._n + upto:
+            raise ValueError(f"{d} outside the calendar range {self.start} - {self.end}")
+        return i
+
+    def _rank_of(self, i: int, roll: str) -> int:
+        """position in bdays of day 'i' rolled to a business day"""
+        if roll == FOLLOWING:
+            return self._rank[i]
+        if roll == PRECEDING:
+            return self._rank[i + 1] - 1
+        raise ValueError(f"roll must be {FOLLOWING!r} or {PRECEDING!r}, got {roll!r}")
+
+    def _bday(self, k: int) -> date:
+        if not 0 <= k < len(self._bdays):
+            raise ValueError("result outside the calendar range")
+        return date.fromordinal(self._bdays[k])
+
+    def is_business_day(self, d: date) -> bool:
+        i = self._idx(d)
+        return self._rank[i + 1] != self._rank[i]
+
+    def count(self, begin: date, end: date) -> int:
+        """business days in [begin, end), negative when end < begin"""
+        return self._rank[self._idx(end, upto=1)] - self._rank[self._idx(begin, upto=1)]
+
+    def roll(self, d: date, roll: str = FOLLOWING) -> date:
+        """'d' itself if it is a business day, otherwise the next (or previous) one"""
+        return self._bday(self._rank_of(self._idx(d), roll))
+
+    def add(self, d: date, n: int, roll: str = FOLLOWING) -> date:
+        """'n' business days after (before if negative) 'd', rolled first"""
+        return self._bday(self._rank_of(self._idx(d), roll) + n)
+
+    # vectorized -------------------------------------------------------------
+
+    def _arrays(self):
+        if np is None:
+            raise ImportError("the vec_ methods need numpy")
+        if self._np is None:
+            rank = np.frombuffer(self._rank, dtype=np.int64)
+            bdays = (np.frombuffer(self._bdays, dtype=np.int64) - _EPOCH_ORDINAL).astype("datetime64[D]")
+            self._np = rank, bdays
+        return self._np
+
+    def _vec_idx(self, x, upto: int = 0):
+        i = _to_days(x).astype(np.int64) - (self._first - _EPOCH_ORDINAL)
+        if i.size and (i.min() < 0 or i.max() >= self._n + upto):
+            raise ValueError(f"dates outside the calendar range {self.start} - {self.end}")
+        return i
+
+    def _vec_rank_of(self, i, roll: str):
+        rank, _ = self._arrays()
+        if roll == FOLLOWING:
+            return rank[i]
+        if roll == PRECEDING:
+            return rank[i + 1] - 1
+        raise ValueError(f"roll must be {FOLLOWING!r} or {PRECEDING!r}, got {roll!r}")
+
+    def _vec_bday(self, k):
+        _, bdays = self._arrays()
+        if k.size and (k.min() < 0 or k.max() >= len(bdays)):
+            raise ValueError("result outside the calendar range")
+        return bdays[k]
+
+    def vec_is_business_day(self, x):
+        rank, _ = self._arrays()
+        i = self._vec_idx(x)
+        return _like(x, rank[i + 1] != rank[i])
+
+    def vec_count(self, begin, end):
+        rank, _ = self._arrays()
+        return _like(begin, rank[self._vec_idx(end, upto=1)] - rank[self._vec_idx(begin, upto=1)])
+
+    def vec_roll(self, x, roll: str = FOLLOWING):
+        return _like(x, self._vec_bday(self._vec_rank_of(self._vec_idx(x), roll)))
+
+    def vec_add(self, x, n, roll: str = FOLLOWING):
+        k = self._vec_rank_of(self._vec_idx(x), roll) + np.asarray(n, dtype=np.int64)
+        return _like(x, self._vec_bday(k))
+
+# =============================================================================
+# vectorized forms: same results as the scalar functions above, on numpy
+# datetime64 arrays or pandas Series (times of day are dropped). NaT stays
+# NaT (False / 0 for the predicates and the int results)
+
+def _to_days(x):
+    if np is None:
+        raise ImportError("the vec_ functions need numpy")
+    return np.asarray(x, dtype="datetime64[D]")
+
+
+def _like(x, r):
+    """give back a Series when a Series came in"""
+    if hasattr(x, "index") and hasattr(x, "to_numpy"):
+        return type(x)(r, index=x.index, name=getattr(x, "name", None))
+    return r
+
+
+def _vectorized(f):
+    @functools.wraps(f)
+    def inner(x, *args):
+        d = _to_days(x)
+        nat = np.isnat(d)
+        has_nat = nat.any()
+        if has_nat:
+            d = np.where(nat, np.datetime64(0, "D"), d)
+        r = f(d, *args)
+        if has_nat:
+            fill = np.datetime64("NaT") if r.dtype.kind == "M" else np.zeros((), r.dtype)
+            r = np.where(nat, fill, r)
+        return _like(x, r)
+    return inner
+
+
+def _weekday(d):
+    # 1970-01-01 was a thursday
+    return (d.astype(np.int64) + WEEKDAY_THU) % DAYS_IN_WEEK
+
+
+def _month(d):
+    return d.astype("datetime64[M]").astype(np.int64) % 12 + 1
+
+
+@_vectorized
+def vec_weekday(d):
+    return _weekday(d)
+
+
+@_vectorized
+def vec_prev_day(d):
+    return d - 1
+
+
+@_vectorized
+def vec_next_day(d):
+    return d + 1
+
+
+@_vectorized
+def vec_prev_week(d):
+    return d - DAYS_IN_WEEK
+
+
+@_vectorized
+def vec_next_week(d):
+    return d + DAYS_IN_WEEK
+
+
+@_vectorized
+def vec_add_months(d, n):
+    """shift by 'n' months (int or array), the day is clamped to the end of the month"""
+    months = d.astype("datetime64[M]")
+    offset = d - months.astype("datetime64[D]")
+    target = months + np.asarray(n, dtype=np.int64).astype("timedelta64[M]")
+    eom = (target + 1).astype("datetime64[D]") - 1
+    return np.minimum(target.astype("datetime64[D]") + offset, eom)
+
+
+def vec_prev_month(d):
+    return vec_add_months(d, -1)
+
+
+def vec_next_month(d):
+    return vec_add_months(d, 1)
+
+
+def vec_prev_year(d):
+    return vec_add_months(d, -12)
+
+
+def vec_next_year(d):
+    return vec_add_months(d, 12)
+
+
+@_vectorized
+def vec_quarter(d):
+    return 1 + (_month(d) - 1) // 3
+
+
+@_vectorized
+def vec_semester(d):
+    return np.where(_month(d) < 7, 1, 2)
+
+
+@_vectorized
+def vec_start_of_month(d):
+    return d.astype("datetime64[M]").astype("datetime64[D]")
+
+
+@_vectorized
+def vec_end_of_month(d):
+    return (d.astype("datetime64[M]") + 1).astype("datetime64[D]") - 1
+
+
+@_vectorized
+def vec_start_of_year(d):
+    return d.astype("datetime64[Y]").astype("datetime64[D]")
+
+
+@_vectorized
+def vec_end_of_year(d):
+    return (d.astype("datetime64[Y]") + 1).astype("datetime64[D]") - 1
+
+
+@_vectorized
+def vec_start_of_week(d):
+    return d - _weekday(d)
+
+
+@_vectorized
+def vec_end_of_week(d):
+    return d + (WEEKDAY_SUN - _weekday(d))
+
+
+@_vectorized
+def vec_is_weekend(d):
+    return _weekday(d) > WEEKDAY_FRI
+
+
+@_vectorized
+def vec_is_workday(d):
+    return _weekday(d) < WEEKDAY_SAT
+
+
+@_vectorized
+def vec_previous_working_day(d):
+    p = d - 1
+    return p - np.maximum(_weekday(p) - WEEKDAY_FRI, 0)
+
+
+@_vectorized
+def vec_next_working_day(d):
+    n = d + 1
+    wd = _weekday(n)
+    return n + np.where(wd > WEEKDAY_FRI, DAYS_IN_WEEK - wd, 0)
+
+
+@_vectorized
+def vec_previous_monday(d):
+    wd = _weekday(d)
+    return d - np.where(wd == WEEKDAY_MON, DAYS_IN_WEEK, wd)
+
+
+@_vectorized
+def vec_next_monday(d):
+    return d + (DAYS_IN_WEEK - _weekday(d))
+
+
+@_vectorized
+def vec_previous_friday(d):
+    wd = _weekday(d)
+    return d - np.where(wd == WEEKDAY_FRI, DAYS_IN_WEEK, (wd + 3) % DAYS_IN_WEEK)
+
+
+@_vectorized
+def vec_next_friday(d):
+    offsets = np.array((4, 3, 2, 1, 7, 6, 5))
+    return d + offsets[_weekday(d)]
@@ -4,9 +4,13 @@ basic extensions of the pathlib module
 usually for project-level stuff, like dynamically locating an asset file
 """
 
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime
+import json
+import os
 from pathlib import Path
-from typing import Callable, Generator, TypeVar
+from typing import Callable, Generator, Iterable, Iterator, Literal, Optional, TypeVar
 
 # =============================================================================
 # scaffolding
@@ -14,6 +18,9 @@ from typing import Callable, Generator, TypeVar
 T = TypeVar("T")
 MaybePath = Path | None
 Paths = Generator[Path, None, None]
+Entries = Generator[os.DirEntry, None, None]
+Prune = Optional[Callable[[os.DirEntry], bool]]
+Order = Literal["dfs", "bfs"]
 
 
 def ctime(f: Path) -> datetime:
@@ -29,28 +36,239 @@ def maybe_gen(gen: Generator[T, None, None]) -> T | None:
         return None
 
 
+def _scandir(d: str) -> list[os.DirEntry]:
+    try:
+        with os.scandir(d) as it:
+            return list(it)
+    except OSError:  # permissions, vanished dirs, ...
+        return []
+
+
+def _descend(e: os.DirEntry, follow_symlinks: bool, prune: Prune) -> bool:
+    try:
+        if not e.is_dir(follow_symlinks=follow_symlinks):
+            return False
+    except OSError:
+        return False
+    return prune is None or not prune(e)
+
+
+def _dir_id(d: str) -> Optional[tuple[int, int]]:
+    try:
+        st = os.stat(d)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+def scan(
+    root            : Path,
+    *,
+    order           : Order = "dfs",
+    max_depth       : Optional[int] = None,
+    prune           : Prune = None,
+    follow_symlinks : bool = True,
+) -> Entries:
+    """
+    iterative walk yielding the os.DirEntry of everything below 'root'
+
+    DirEntry caches the file type from the directory listing, so checks like
+    is_file()/is_dir() cost no extra syscall
+    * order           : "dfs" (pre-order, like recursive_traverse) or "bfs"
+    * max_depth       : entries directly inside 'root' are at depth 1
+    * prune           : called on each dir, True skips its content (the dir itself is still yielded)
+    * follow_symlinks : descend into symlinked dirs. each dir (st_dev, st_ino)
+                        is listed once, so symlink loops end
+    """
+    seen: set[tuple[int, int]] = set()
+
+    def enter(d: str) -> bool:
+        if not follow_symlinks:
+            return True
+        key = _dir_id(d)
+        if key is None or key in seen:
+            return False
+        seen.add(key)
+        return True
+
+    if not enter(str(root)):
+        return
+    if order == "bfs":
+        queue = deque([(str(root), 1)])
+        while queue:
+            d, depth = queue.popleft()
+            for e in _scandir(d):
+                yield e
+                if (max_depth is None or depth < max_depth) and _descend(e, follow_symlinks, prune) and enter(e.path):
+                    queue.append((e.path, depth + 1))
+        return
+    stack: list[tuple[Iterator[os.DirEntry], int]] = [(iter(_scandir(str(root))), 1)]
+    while stack:
+        entries, depth = stack[-1]
+        e = next(entries, None)
+        if e is None:
+            stack.pop()
+            continue
+        yield e
+        if (max_depth is None or depth < max_depth) and _descend(e, follow_symlinks, prune) and enter(e.path):
+            stack.append((iter(_scandir(e.path)), depth + 1))
+
+
+def walk(root: Path, **scan_kwargs) -> Paths:
+    """'root' and then every path below it, see scan for the options"""
+    yield root
+    if root.is_dir():
+        yield from (Path(e.path) for e in scan(root, **scan_kwargs))
+
+
 def recursive_traverse(p: Path) -> Paths:
     """DFS-traverse and yield all paths (both dirs AND files)"""
     assert p.exists(), f"does not exist: {p}"
+    yield from walk(p)
+
+
+Listing = list[tuple[str, Optional[tuple[int, int]]]]
+
+
+def _list_entries(d: str, follow_symlinks: bool) -> Listing:
+    """
+    (path, id of the dir to descend into or None) for each entry of 'd'
+
+    the id is (st_dev, st_ino) when following symlinks, it is stat'ed here,
+    on the worker, not on the thread that walks
+    """
+    out = []
+    for e in _scandir(d):
+        key = None
+        if _descend(e, follow_symlinks, None):
+            key = _dir_id(e.path) if follow_symlinks else (0, 0)
+        out.append((e.path, key))
+    return out
+
+
+class _Seen:
+    """dirs already walked (by id), only tracked when following symlinks"""
+
+    def __init__(self, follow_symlinks: bool) -> None:
+        self.follow_symlinks = follow_symlinks
+        self.ids: set[tuple[int, int]] = set()
+
+    def enter(self, key: Optional[tuple[int, int]]) -> bool:
+        if key is None:
+            return False
+        if not self.follow_symlinks:
+            return True
+        if key in self.ids:
+            return False
+        self.ids.add(key)
+        return True
+
+    def known(self, key: Optional[tuple[int, int]]) -> bool:
+        return key is None or (self.follow_symlinks and key in self.ids)
+
+
+def parallel_traverse(
+    p               : Path,
+    workers         : int = 8,
+    max_pending     : int = 64,
+    ordered         : bool = False,
+    follow_symlinks : bool = True,
+) -> Paths:
+    """
+    same output as recursive_traverse, but up to 'workers' dirs are listed
+    at the same time, which hides the latency of network file systems
+
+    * max_pending : listings submitted but not consumed yet, nothing more is
+                    listed until the caller pulls from the generator
+    * ordered     : keep the exact recursive_traverse order (prefetching the
+                    subdirs of the dir being visited), otherwise paths come
+                    out as soon as their dir is listed
+    """
+    assert p.exists(), f"does not exist: {p}"
     yield p
-    if p.is_file():
+    if not p.is_dir():
         return
-    for f in p.iterdir():
-        yield from recursive_traverse(f)
+    seen = _Seen(follow_symlinks)
+    seen.enter(_dir_id(str(p)) if follow_symlinks else (0, 0))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        if ordered:
+            yield from _parallel_ordered(pool, str(p), max_pending, follow_symlinks, seen)
+        else:
+            yield from _parallel_unordered(pool, str(p), max_pending, follow_symlinks, seen)
+
+
+def _parallel_unordered(pool: ThreadPoolExecutor, root: str, max_pending: int, follow_symlinks: bool, seen: _Seen) -> Paths:
+    todo = [root]  # dirs found but not submitted yet, LIFO keeps it small
+    running: set[Future] = set()
+    try:
+        while todo or running:
+            while todo and len(running) < max_pending:
+                running.add(pool.submit(_list_entries, todo.pop(), follow_symlinks))
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                for path, key in fut.result():
+                    yield Path(path)
+                    if seen.enter(key):
+                        todo.append(path)
+    finally:
+        for fut in running:
+            fut.cancel()
+
+
+def _parallel_ordered(pool: ThreadPoolExecutor, root: str, max_pending: int, follow_symlinks: bool, seen: _Seen) -> Paths:
+    prefetched: dict[str, Future] = {}
+
+    def listing(d: str) -> Listing:
+        fut = prefetched.pop(d, None) or pool.submit(_list_entries, d, follow_symlinks)
+        entries = fut.result()
+        for path, key in entries:
+            if len(prefetched) >= max_pending:
+                break
+            if not seen.known(key) and path not in prefetched:
+                prefetched[path] = pool.submit(_list_entries, path, follow_symlinks)
+        return entries
+
+    try:
+        stack = [iter(listing(root))]
+        while stack:
+            item = next(stack[-1], None)
+            if item is None:
+                stack.pop()
+                continue
+            path, key = item
+            yield Path(path)
+            if seen.enter(key):
+                stack.append(iter(listing(path)))
+            else:
+                fut = prefetched.pop(path, None)  # a second link to a walked dir
+                if fut is not None:
+                    fut.cancel()
+    finally:
+        for fut in prefetched.values():
+            fut.cancel()
 
 # =============================================================================
 # basic search functionality
 
-def find_by_filter(f: Callable[[Path], bool], root: Path) -> Paths:
-    yield from (p for p in recursive_traverse(root) if f(p))
+def find_by_filter(f: Callable[[Path], bool], root: Path, **scan_kwargs) -> Paths:
+    yield from (p for p in walk(root, **scan_kwargs) if f(p))
+
 
+def _find_entries(f: Callable[[os.DirEntry], bool], root: Path, **scan_kwargs) -> Paths:
+    """like find_by_filter, but the filter gets the DirEntry and its cached type info"""
+    yield from (Path(e.path) for e in scan(root, **scan_kwargs) if f(e))
 
-def find_file(name: str, root: Path) -> Paths:
-    yield from find_by_filter(lambda p: p.name == name and p.is_file(), root)
 
+def find_file(name: str, root: Path, **scan_kwargs) -> Paths:
+    if root.name == name and root.is_file():
+        yield root
+    yield from _find_entries(lambda e: e.name == name and e.is_file(), root, **scan_kwargs)
 
-def find_dir(name: str, root: Path) -> Paths:
-    yield from find_by_filter(lambda p: p.name == name and p.is_dir(), root)
+
+def find_dir(name: str, root: Path, **scan_kwargs) -> Paths:
+    if root.name == name and root.is_dir():
+        yield root
+    yield from _find_entries(lambda e: e.name == name and e.is_dir(), root, **scan_kwargs)
 
 # =============================================================================
 # short-circuited form of the above
@@ -66,6 +284,121 @@ def find_first_file(name: str, root: Path) -> MaybePath:
 def find_first_dir(name: str, root: Path) -> MaybePath:
     return maybe_gen(find_dir(name, root))
 
+# =============================================================================
+# many lookups under the same root
+
+def find_files(names: Iterable[str], root: Path, **scan_kwargs) -> dict[str, Path]:
+    """
+    the first file found for each name, in a single traversal that stops as
+    soon as every name is found. missing names are missing from the result
+    """
+    todo = set(names)
+    out: dict[str, Path] = {}
+    if root.is_file() and root.name in todo:
+        out[root.name] = root
+        todo.discard(root.name)
+    if not todo:
+        return out
+    for e in scan(root, **scan_kwargs):
+        if e.name in todo and e.is_file():
+            out[e.name] = Path(e.path)
+            todo.discard(e.name)
+            if not todo:
+                break
+    return out
+
+
+class PathIndex:
+    """
+    name -> paths of the files under 'root'
+
+    built on the first lookup with a single traversal. a lookup checks the
+    mtime of the dirs holding the hits (of every dir when there is no hit)
+    and rebuilds the index if any changed. with 'cache_file' the index is
+    also stored on disk and reused by the next process
+    """
+
+    def __init__(self, root: Path, cache_file: Optional[Path] = None, **scan_kwargs) -> None:
+        self.root = root
+        self.cache_file = cache_file
+        self.scan_kwargs = scan_kwargs
+        self._files: Optional[dict[str, list[str]]] = None
+        self._dirs: dict[str, int] = {}
+
+    def _load(self) -> bool:
+        if self.cache_file is None:
+            return False
+        try:
+            with self.cache_file.open() as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return False
+        if data.get("root") != str(self.root):
+            return False
+        self._files, self._dirs = data["files"], data["dirs"]
+        return True
+
+    def save(self):
+        if self.cache_file is None or self._files is None:
+            return
+        tmp = self.cache_file.with_name(self.cache_file.name + ".tmp")
+        with tmp.open("w") as fp:
+            json.dump({"root": str(self.root), "dirs": self._dirs, "files": self._files}, fp)
+        os.replace(tmp, self.cache_file)
+
+    def refresh(self):
+        """full rebuild"""
+        files: dict[str, list[str]] = {}
+        dirs = {str(self.root): os.stat(self.root).st_mtime_ns}
+        for e in scan(self.root, **self.scan_kwargs):
+            try:
+                if e.is_dir():
+                    dirs[e.path] = e.stat().st_mtime_ns
+                elif e.is_file():
+                    files.setdefault(e.name, []).append(e.path)
+            except OSError:
+                continue
+        self._files, self._dirs = files, dirs
+        self.save()
+
+    def _stale(self, dirs: Iterable[str]) -> bool:
+        for d in dirs:
+            try:
+                if os.stat(d).st_mtime_ns != self._dirs.get(d):
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def files(self, name: str) -> list[Path]:
+        if self._files is None and not self._load():
+            self.refresh()
+        hits = self._files.get(name, [])
+        to_check = {os.path.dirname(h) for h in hits} if hits else self._dirs.keys()
+        if self._stale(to_check):
+            self.refresh()
+            hits = self._files.get(name, [])
+        return [Path(h) for h in hits]
+
+    def first_file(self, name: str) -> MaybePath:
+        hits = self.files(name)
+        return hits[0] if hits else None
+
+
+_INDEXES: dict[tuple, PathIndex] = {}
+
+
+def path_index(root: Path, cache_file: Optional[Path] = None, **scan_kwargs) -> PathIndex:
+    """the PathIndex of 'root' built with these options, shared by the whole process"""
+    root = root.resolve()
+    if cache_file is not None:
+        cache_file = cache_file.resolve()
+    key = (root, cache_file, tuple(sorted(scan_kwargs.items())))
+    idx = _INDEXES.get(key)
+    if idx is None:
+        idx = _INDEXES[key] = PathIndex(root, cache_file, **scan_kwargs)
+    return idx
+
 # =============================================================================
 
 def main():
@@ -17,18 +17,351 @@ def main():  # or any other func
     log.info("some info from my project")
 ```
 
+with `configure_logs(PR_LOG, asynchronous=True)` the calling thread only puts
+the record on a queue, a background listener thread does the actual I/O
+
+for hot paths: `json_format=True` for machine-parseable lines,
+`rate_limit=N` for at most N records per second from each call site and
+`sample={logging.DEBUG: 0.01}` to keep only a fraction of the low levels
+
 # many thanks to:
 https://www.youtube.com/watch?v=-YelOky3ZRE&list=WL&index=4
 """
 
+import atexit
+import copy
+from datetime import datetime, timedelta, timezone
+import gzip
+import json
 import logging
 import logging.handlers
+import os
 from pathlib import Path
+import queue
+import random
+import shutil
 import sys
+import threading
+import time
+
+try:
+    import zstandard  # optional, for compress="zstd"
+except ImportError:
+    zstandard = None
+
+
+_TRACEBACKS = logging.Formatter()
+
+# attributes every LogRecord has, anything else came from 'extra='
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    one json object per line
+
+    like every Formatter it only runs for records that get emitted, so
+    filtered, sampled and rate-limited records are never formatted
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts"     : datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level"  : record.levelname,
+            "logger" : record.name,
+            "func"   : record.funcName,
+            "line"   : record.lineno,
+            "msg"    : record.getMessage(),
+        }
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc"] = record.exc_text
+        for k, v in vars(record).items():
+            if k not in _RECORD_ATTRS and not k.startswith("_"):
+                out[k] = v
+        return json.dumps(out, default=str)
+
+
+def _verdict_once(f: logging.Filter, record: logging.LogRecord, decide) -> bool:
+    """the same verdict on every handler the record goes through"""
+    key = f"_verdict_{id(f)}"
+    verdict = record.__dict__.get(key)
+    if verdict is None:
+        verdict = decide(record)
+        setattr(record, key, verdict)
+    return verdict
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    at most 'per_second' records per second from each call site (file, line)
+
+    the first record let through after a suppressed stretch carries the
+    count in 'record.suppressed' and a note appended to its message
+    """
+
+    def __init__(self, per_second: int) -> None:
+        super().__init__()
+        self.per_second = per_second
+        self._sites: dict[tuple[str, int], list] = {}  # site -> [window start, count, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return _verdict_once(self, record, self._decide)
+
+    def _decide(self, record: logging.LogRecord) -> bool:
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = [now, 0, 0]
+            if now - site[0] >= 1.0:
+                site[0], site[1] = now, 0
+            site[1] += 1
+            if site[1] > self.per_second:
+                site[2] += 1
+                return False
+            suppressed, site[2] = site[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f"{record.msg} [{suppressed} similar records suppressed]"
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """keep each record with the probability given for its level, e.g. {logging.DEBUG: 0.01}"""
+
+    def __init__(self, rates: dict[int, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return _verdict_once(self, record, self._decide)
+
+    def _decide(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno)
+        return rate is None or random.random() < rate
+
+
+class _BoundedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that either blocks or drops (and counts) when the queue is full"""
+
+    def __init__(self, q: queue.Queue, block: bool) -> None:
+        super().__init__(q)
+        self.block = block
+        self.dropped = 0
 
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        no formatting on the logging thread, the listener's formatter does it.
+        only the traceback is rendered now, while the exception is alive
+        """
+        record = copy.copy(record)
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _TRACEBACKS.formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
-def configure_logs(app_name: str):
-    """ basic logging config """
+    def enqueue(self, record: logging.LogRecord):
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _BlockingListener(logging.handlers.QueueListener):
+    """the stop sentinel must get in even when the queue is full"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def _stop_listener(listener: logging.handlers.QueueListener, qh: _BoundedQueueHandler):
+    if listener._thread is not None:  # not already stopped by the caller
+        listener.stop()  # drains what is left on the queue
+    if qh.dropped:
+        print(f"logger_setup: {qh.dropped} log records dropped (queue full)", file=sys.stderr)
+
+
+class CompressingRotatingFileHandler(logging.handlers.BaseRotatingHandler):
+    """
+    rotates on size and/or time, compresses in the background
+
+    the logging thread only renames the full file to '<name>.<timestamp>'
+    (utc, microseconds, strictly increasing, so names sort in rotation order), a
+    worker thread compresses it ('gzip' or 'zstd', None to keep it plain) and
+    then applies the retention policy: at most 'backup_count' rotated files
+    (0 is unlimited) and at most 'disk_budget' bytes for all of them. files
+    whose compression failed still count
+    """
+
+    _SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+    def __init__(
+        self,
+        filename     : Path,
+        max_bytes    : int = 0,
+        interval     : float | None = None,
+        compress     : str | None = "gzip",
+        backup_count : int = 0,
+        disk_budget  : int | None = None,
+        encoding     : str | None = None,
+    ) -> None:
+        if compress not in self._SUFFIXES:
+            raise ValueError(f"unknown compression: {compress}")
+        if compress == "zstd" and zstandard is None:
+            raise ValueError("compress='zstd' needs the zstandard package")
+        super().__init__(filename, "a", encoding=encoding)
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.compress = compress
+        self.backup_count = backup_count
+        self.disk_budget = disk_budget
+        self.rollover_at = None if interval is None else time.time() + interval
+        self._last_stamp = 0  # microseconds of the last rotation
+        self._pending: set[Path] = set()  # renamed, not yet through the compressor
+        self._pending_lock = threading.Lock()
+        self._jobs: queue.Queue[Path | None] = queue.Queue()
+        self._worker = threading.Thread(target=self._work, name="LogCompressor", daemon=True)
+        self._worker.start()
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        # no formatting here, the file may exceed max_bytes by one record
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        if self.max_bytes > 0:
+            if self.stream is None:
+                self.stream = self._open()
+            return self.stream.tell() >= self.max_bytes
+        return False
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        base = Path(self.baseFilename)
+        if base.exists() and base.stat().st_size > 0:
+            target = base.with_name(f"{base.name}.{self._stamp()}")
+            os.rename(base, target)
+            with self._pending_lock:
+                self._pending.add(target)
+            self._jobs.put(target)
+        if self.interval is not None:
+            self.rollover_at = time.time() + self.interval
+        self.stream = self._open()
+
+    def _stamp(self) -> str:
+        us = max(time.time_ns() // 1000, self._last_stamp + 1)
+        self._last_stamp = us
+        secs, us = divmod(us, 1_000_000)
+        # utc: local time repeats an hour when dst ends, and the names must sort
+        return (datetime.fromtimestamp(secs, timezone.utc) + timedelta(microseconds=us)).strftime("%Y%m%d-%H%M%S-%f")
+
+    def _compressed(self, f: Path) -> Path:
+        return f.with_name(f.name + self._SUFFIXES[self.compress])
+
+    def _compress(self, f: Path):
+        if self.compress is None:
+            return
+        out = self._compressed(f)
+        tmp = out.with_name(out.name + ".tmp")
+        with f.open("rb") as src:
+            if self.compress == "gzip":
+                with gzip.open(tmp, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+            else:
+                with tmp.open("wb") as raw, zstandard.ZstdCompressor().stream_writer(raw) as dst:
+                    shutil.copyfileobj(src, dst)
+        os.replace(tmp, out)
+        f.unlink()
+
+    def _enforce_retention(self):
+        base = Path(self.baseFilename)
+        with self._pending_lock:
+            pending = set(self._pending)
+        rotated = [
+            (p, p.stat())
+            for p in base.parent.glob(base.name + ".*")
+            if not p.name.endswith(".tmp") and p not in pending
+        ]
+        # the timestamp in the name, not the mtime (compression rewrites it)
+        rotated.sort(key=lambda x: x[0].name, reverse=True)
+        total = 0
+        for n, (p, st) in enumerate(rotated, start=1):
+            total += st.st_size
+            over_count = self.backup_count > 0 and n > self.backup_count
+            over_budget = self.disk_budget is not None and total > self.disk_budget
+            if over_count or over_budget:
+                p.unlink(missing_ok=True)
+
+    def _work(self):
+        while True:
+            f = self._jobs.get()
+            if f is None:
+                return
+            try:
+                self._compress(f)
+            except OSError as e:
+                print(f"logger_setup: could not compress {f}: {e}", file=sys.stderr)
+            with self._pending_lock:
+                self._pending.discard(f)
+            try:
+                self._enforce_retention()
+            except OSError as e:
+                print(f"logger_setup: could not apply the retention policy: {e}", file=sys.stderr)
+
+    def close(self):
+        if self._worker.is_alive():
+            self._jobs.put(None)
+            self._worker.join()
+        super().close()
+
+
+def configure_logs(
+    app_name     : str,
+    *,
+    level        : int = logging.INFO,
+    asynchronous : bool = False,
+    queue_size   : int = 10_000,
+    block        : bool = True,
+    json_format  : bool = False,
+    rate_limit   : int | None = None,
+    sample       : dict[int, float] | None = None,
+    compress     : str | None = None,
+    rotate_every : float | None = None,
+    disk_budget  : int | None = None,
+) -> logging.handlers.QueueListener | None:
+    """
+    basic logging config
+
+    * level        : level of the app logger. levels listed in 'sample' get
+                     through (sampled) even when they are lower
+    * asynchronous : the app logger gets a QueueHandler and the real handlers
+                     run on a QueueListener thread, stopped (and drained) at exit
+    * queue_size   : bound of the queue in asynchronous mode
+    * block        : when the queue is full, wait (True) or drop the record (False)
+    * json_format  : JsonFormatter instead of the plain text one
+    * rate_limit   : RateLimitFilter, max records per second per call site
+    * sample       : SamplingFilter, level -> fraction of the records to keep
+    * compress     : "gzip" or "zstd", rotated files are compressed in background
+    * rotate_every : also rotate every N seconds, not only every 10 MB
+    * disk_budget  : max bytes for all the rotated files, oldest go first
+                     (replaces the default limit of 6 backups)
+
+    any of the last three switches to CompressingRotatingFileHandler
+
+    the filters sit on the handlers, so they also see the records of the
+    child loggers ("app.db", ...); records dropped by them cost neither
+    formatting nor I/O
+
+    returns the listener in asynchronous mode
+    """
     MB = 1<<20
     DATE_FMT = "%Y-%m-%d %H:%M:%S"
     log_path = Path(__file__).parent / "logs" 
@@ -36,23 +369,58 @@ def configure_logs(app_name: str):
 
     stream_h = logging.StreamHandler(stream=sys.stdout)
 
-    fmter = logging.Formatter(
-        fmt="{name} [{asctime}] {levelname} ({funcName}) - {message}",
-        style="{",
-        datefmt=DATE_FMT
-    )
+    if json_format:
+        fmter = JsonFormatter()
+    else:
+        fmter = logging.Formatter(
+            fmt="{name} [{asctime}] {levelname} ({funcName}) - {message}",
+            style="{",
+            datefmt=DATE_FMT
+        )
     stream_h.setFormatter(fmter)
 
 
-    rotating_file_h = logging.handlers.RotatingFileHandler(
-        filename = log_path / "rotating.log",
-        maxBytes = MB * 10,
-        backupCount = 6
-    )
+    if compress is None and rotate_every is None and disk_budget is None:
+        rotating_file_h = logging.handlers.RotatingFileHandler(
+            filename = log_path / "rotating.log",
+            maxBytes = MB * 10,
+            backupCount = 6
+        )
+    else:
+        rotating_file_h = CompressingRotatingFileHandler(
+            filename     = log_path / "rotating.log",
+            max_bytes    = MB * 10,
+            interval     = rotate_every,
+            compress     = compress,
+            backup_count = 0 if disk_budget is not None else 6,
+            disk_budget  = disk_budget,
+        )
     rotating_file_h.setFormatter(fmter)
 
+    filters = []
+    if sample:
+        # the logger level is lowered for the sampled levels only
+        filters.append(lambda r: r.levelno >= level or r.levelno in sample)
+        filters.append(SamplingFilter(sample))
+    if rate_limit is not None:
+        filters.append(RateLimitFilter(rate_limit))
+
     app_log = logging.getLogger(app_name)
-    app_log.setLevel(logging.INFO)
-    app_log.addHandler(stream_h)
-    app_log.addHandler(rotating_file_h)
+    app_log.setLevel(min(level, *sample) if sample else level)
+    if not asynchronous:
+        for h in (stream_h, rotating_file_h):
+            for f in filters:
+                h.addFilter(f)
+            app_log.addHandler(h)
+        return None
+
+    q = queue.Queue(maxsize=queue_size)
+    queue_h = _BoundedQueueHandler(q, block)
+    for f in filters:
+        queue_h.addFilter(f)
+    listener = _BlockingListener(q, stream_h, rotating_file_h, respect_handler_level=True)
+    app_log.addHandler(queue_h)
+    listener.start()
+    atexit.register(_stop_listener, listener, queue_h)
+    return listener
 
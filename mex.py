@@ -1,3 +1,5 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 import itertools
 import typing as ty
 
@@ -17,13 +19,83 @@ def sigma_algebra(it: list[T]) -> Gen[list[T]]:
         yield from map(list, itertools.combinations(it, i))
 
 
+def _chunks(it: ty.Iterable[T], size: int) -> Gen[list[T]]:
+    it = iter(it)
+    while chunk := list(itertools.islice(it, size)):
+        yield chunk
+
+# =============================================================================
+# process pool
+# the data is shipped once per worker by the initializer, tasks only carry
+# the regressors names
+
+_worker_y: ty.Any = None
+_worker_data: ty.Any = None
+_worker_modelf: ty.Any = None
+
+
+def _init_worker(y_data, data, modelf):
+    global _worker_y, _worker_data, _worker_modelf
+    _worker_y, _worker_data, _worker_modelf = y_data, data, modelf
+
+
+def _fit_chunk(chunk: list[list[str]]) -> list:
+    return [_worker_modelf(_worker_y, _worker_data[x]) for x in chunk]
+
+
+def _parallel_models(
+    pool      : ty.Iterable[list[str]],
+    y_data    : ty.Any,
+    data      : ty.Any,
+    modelf    : ty.Callable,
+    workers   : int,
+    ordered   : bool,
+    chunksize : int,
+) -> Gen:
+    max_pending = 2 * workers  # bounds memory, 2^n subsets are never all queued
+    chunks = _chunks(pool, chunksize)
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(y_data, data, modelf)) as ex:
+        if ordered:
+            queue: deque[Future] = deque()
+            try:
+                for chunk in chunks:
+                    queue.append(ex.submit(_fit_chunk, chunk))
+                    if len(queue) >= max_pending:
+                        yield from queue.popleft().result()
+                while queue:
+                    yield from queue.popleft().result()
+            finally:
+                # the consumer may stop early, do not wait for the chunks nobody reads
+                for fut in queue:
+                    fut.cancel()
+            return
+        pending: set[Future] = set()
+        try:
+            for chunk in chunks:
+                pending.add(ex.submit(_fit_chunk, chunk))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        yield from fut.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    yield from fut.result()
+        finally:
+            for fut in pending:
+                fut.cancel()
+
+
 def estimate_models(
     y            : str,
     xs           : list[str],
     data         : ty.Any,
     modelf       : ty.Callable[[ty.Any, ty.Any], T],
     filterxs     : ty.Optional[Predicate[list[str]]] = None,
-    filtermodels : ty.Optional[Predicate] = None
+    filtermodels : ty.Optional[Predicate] = None,
+    workers      : ty.Optional[int] = None,
+    ordered      : bool = False,
+    chunksize    : int = 16,
 ) -> Gen[T]:
     """
     * y            : data[y] is the y data points
@@ -32,12 +104,20 @@ def estimate_models(
     * modelf       : a function that takes data[y] and data[xs] data points and returns an estimation
     * filterxs     : optional predicate to filter out unwanted regressors combinations
     * filtermodels : optional predicate to filter out models after estimation
+    * workers      : fit the models on a pool of 'workers' processes. modelf and
+                     data must be picklable (modelf defined at module level)
+    * ordered      : with workers, yield the models in the sequential order
+                     instead of as soon as they are ready
+    * chunksize    : with workers, number of subsets sent to a process at once
     """
     pool = sigma_algebra(xs)
     if filterxs is not None:
         pool = filter(filterxs, pool)
     y_data = data[y]
-    pool = (modelf(y_data, data[x]) for x in pool)
+    if workers is None:
+        pool = (modelf(y_data, data[x]) for x in pool)
+    else:
+        pool = _parallel_models(pool, y_data, data, modelf, workers, ordered, chunksize)
     if filtermodels is not None:
         pool = filter(filtermodels, pool)
     yield from pool
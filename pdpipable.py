@@ -1,12 +1,291 @@
-from typing import Callable
+import functools
+import hashlib
+import os
+from pathlib import Path
+import pickle
+import time
+from typing import Callable, Generator, Iterable, NamedTuple, Optional
 
+import pandas as pd
 from pandas import DataFrame as DF
 
 
-def pipable(f: Callable):
-    """decorator for functions fed to pandas.pipe"""
-    def inner(*args, **kwargs) -> DF:
-        assert isinstance(args[0], DF)
+class StepStats(NamedTuple):
+    """what happened during a single pipe step"""
+    name     : str
+    seconds  : float
+    rows_in  : int
+    cols_in  : int
+    rows_out : int
+    cols_out : int
+    mem_in   : int
+    mem_out  : int
+    copied   : bool  # same shape and columns, but a brand new frame
+
+    def __str__(self) -> str:
+        flag = " (copy: could work in place?)" if self.copied else ""
+        return (
+            f"{self.name}: {self.seconds:.4f}s "
+            f"{self.rows_in}x{self.cols_in} -> {self.rows_out}x{self.cols_out} "
+            f"{_fmt_bytes(self.mem_in)} -> {_fmt_bytes(self.mem_out)}{flag}"
+        )
+
+
+def _fmt_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024:
+            return f"{n:.0f}{unit}"
+        n /= 1024
+    return f"{n:.1f}TB"
+
+
+def _deep_memory(df: DF) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class PipelineReport:
+    """
+    collects a StepStats for each instrumented step
+
+    report = PipelineReport()
+
+    @pipable(report=report)
+    def step(df): ...
+
+    df.pipe(step).pipe(other_step)
+    print(report)
+    """
+
+    def __init__(self) -> None:
+        self.steps: list[StepStats] = []
+
+    def record(self, stats: StepStats):
+        self.steps.append(stats)
+
+    def clear(self):
+        self.steps.clear()
+
+    @property
+    def seconds(self) -> float:
+        return sum(s.seconds for s in self.steps)
+
+    def slowest(self) -> Optional[StepStats]:
+        return max(self.steps, key=lambda s: s.seconds, default=None)
+
+    def copies(self) -> list[StepStats]:
+        return [s for s in self.steps if s.copied]
+
+    def __str__(self) -> str:
+        lines = [str(s) for s in self.steps]
+        lines.append(f"total: {self.seconds:.4f}s over {len(self.steps)} steps")
+        return "\n".join(lines)
+
+
+class StepCache:
+    """
+    on-disk memoization of pipe steps
+
+    a result is keyed on the step qualified name, its extra arguments and a
+    content hash of the input frame. results are pickled (protocol 5) into
+    'folder'; once the folder grows past 'max_bytes' the least recently
+    used entries are evicted
+
+    cache = StepCache(Path("~/.cache/pipes").expanduser())
+
+    @pipable(cache=cache)
+    def step(df, n): ...
+    """
+
+    SUFFIX = ".pkl"
+
+    def __init__(self, folder: Path, max_bytes: int = 1 << 30) -> None:
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def key(self, f: Callable, df: DF, args: tuple, kwargs: dict) -> str:
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{f.__module__}.{f.__qualname__}".encode())
+        h.update(_hash_args(args, kwargs))
+        h.update(repr((tuple(df.columns), tuple(map(str, df.dtypes)))).encode())
+        h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.folder / (key + self.SUFFIX)
+
+    def get(self, key: str) -> Optional[DF]:
+        p = self._path(key)
+        try:
+            fp = p.open("rb")
+        except FileNotFoundError:
+            return None
+        try:
+            with fp:
+                df = pickle.load(fp)
+        except Exception:  # truncated, or written by another pandas/numpy version
+            p.unlink(missing_ok=True)
+            return None
+        os.utime(p)  # mtime doubles as the LRU clock
+        return df
+
+    def put(self, key: str, df: DF):
+        p = self._path(key)
+        tmp = p.with_suffix(".tmp")
+        with tmp.open("wb") as fp:
+            pickle.dump(df, fp, protocol=5)
+        os.replace(tmp, p)
+        self.evict()
+
+    def evict(self):
+        entries = [(e, e.stat()) for e in self.folder.glob("*" + self.SUFFIX)]
+        entries.sort(key=lambda x: x[1].st_mtime)
+        total = sum(st.st_size for _, st in entries)
+        for e, st in entries:
+            if total <= self.max_bytes:
+                break
+            e.unlink(missing_ok=True)
+            total -= st.st_size
+
+    def clear(self):
+        for e in self.folder.glob("*" + self.SUFFIX):
+            e.unlink(missing_ok=True)
+
+
+def _hash_args(args: tuple, kwargs: dict) -> bytes:
+    """
+    TypeError when the arguments can not be serialized deterministically
+    (lambdas, closures, ...): a repr would embed a reusable memory address
+    """
+    extra = (args, sorted(kwargs.items()))
+    try:
+        return pickle.dumps(extra, protocol=5)
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        raise TypeError(f"step arguments can not be used as a cache key: {e}") from e
+
+
+def _cached(f: Callable, df: DF, args, kwargs, cache: StepCache, run: Callable[[], DF]) -> DF:
+    try:
+        key = cache.key(f, df, args[1:], kwargs)
+    except TypeError:  # unhashable cells (lists, dicts, ...) or unpicklable arguments
+        return run()
+    hit = cache.get(key)
+    if hit is not None:
+        return hit
+    out = run()
+    cache.put(key, out)
+    return out
+
+
+def _instrumented(f: Callable, df: DF, args, kwargs, report: PipelineReport) -> DF:
+    mem_in = _deep_memory(df)
+    start = time.perf_counter()
+    r = f(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    out = r if isinstance(r, DF) else df
+    copied = (
+        out is not df
+        and out.shape == df.shape
+        and out.columns.equals(df.columns)
+    )
+    report.record(StepStats(
+        name     = f.__qualname__,
+        seconds  = seconds,
+        rows_in  = df.shape[0],
+        cols_in  = df.shape[1],
+        rows_out = out.shape[0],
+        cols_out = out.shape[1],
+        mem_in   = mem_in,
+        mem_out  = _deep_memory(out),
+        copied   = copied,
+    ))
+    return out
+
+
+def pipable(
+    f         : Optional[Callable] = None,
+    *,
+    report    : Optional[PipelineReport] = None,
+    cache     : Optional[StepCache] = None,
+    row_local : bool = False,
+):
+    """
+    decorator for functions fed to pandas.pipe
+
+    use it bare (@pipable) or with options:
+    * report    : record time, shape and deep memory usage of every call
+    * cache     : reuse the stored result when the step already ran on the same
+                  input and arguments. a cache hit returns the stored frame, so
+                  steps that only mutate their input in place are not re-run
+    * row_local : the output rows depend only on the matching input rows
+                  (filters, derived columns), so the step can run chunk by
+                  chunk, see run_chunked
+    """
+    if f is None:
+        return functools.partial(pipable, report=report, cache=cache, row_local=row_local)
+
+    def run(*args, **kwargs) -> DF:
+        if report is not None:
+            return _instrumented(f, args[0], args, kwargs, report)
         r = f(*args, **kwargs)
         return r if isinstance(r, DF) else args[0]
+
+    @functools.wraps(f)
+    def inner(*args, **kwargs) -> DF:
+        assert isinstance(args[0], DF)
+        if cache is not None:
+            return _cached(f, args[0], args, kwargs, cache, lambda: run(*args, **kwargs))
+        return run(*args, **kwargs)
+    inner.row_local = row_local
     return inner
+
+# =============================================================================
+# out-of-core execution
+
+def _is_row_local(step: Callable) -> bool:
+    # functools.partial is the way to bind the extra arguments of a step
+    return getattr(getattr(step, "func", step), "row_local", False)
+
+
+def iter_chunked(chunks: Iterable[DF], steps: Iterable[Callable]) -> Generator[DF, None, None]:
+    """
+    lazily apply a chain of row-local steps to each chunk
+
+    only one chunk at a time is alive, e.g.
+
+    chunks = pd.read_csv(big_file, chunksize=100_000)
+    for df in iter_chunked(chunks, [drop_nulls, partial(add_ratio, col="x")]):
+        ...
+    """
+    steps = list(steps)
+    bad = [getattr(getattr(s, "func", s), "__qualname__", repr(s)) for s in steps if not _is_row_local(s)]
+    if bad:
+        raise ValueError(f"steps not marked as @pipable(row_local=True): {bad}")
+    return _apply_chunked(chunks, steps)
+
+
+def _apply_chunked(chunks: Iterable[DF], steps: list[Callable]) -> Generator[DF, None, None]:
+    for chunk in chunks:
+        for step in steps:
+            chunk = chunk.pipe(step)
+        yield chunk
+
+
+def run_chunked(chunks: Iterable[DF], steps: Iterable[Callable], sink: Callable[[DF], None]) -> int:
+    """stream the processed chunks into 'sink', returns the number of rows written"""
+    rows = 0
+    for chunk in iter_chunked(chunks, steps):
+        sink(chunk)
+        rows += len(chunk)
+    return rows
+
+
+def csv_sink(f: Path, **to_csv_kwargs) -> Callable[[DF], None]:
+    """sink that writes the first chunk with the header and appends the others"""
+    first = True
+
+    def sink(df: DF):
+        nonlocal first
+        df.to_csv(f, mode="w" if first else "a", header=first, index=False, **to_csv_kwargs)
+        first = False
+    return sink
@@ -1,12 +1,140 @@
-
+import atexit
+from collections import Counter
 import cProfile
+import functools
+import inspect
+import logging
+import os
+from pathlib import Path
 import pstats
-from typing import Callable
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from typing import Callable, Generator, NamedTuple, Optional
+
+try:
+    import resource  # not available on windows
+except ImportError:
+    resource = None
+
+
+# the decorators are no-ops unless this is set (e.g. PYUTILS_PROFILE=1), so
+# they can stay in the code. it is read when a function is decorated; the
+# explicit start/stop and context manager forms always run
+ENV_SWITCH = "PYUTILS_PROFILE"
+
+
+def profiling_enabled() -> bool:
+    return os.environ.get(ENV_SWITCH, "0").strip().lower() not in ("", "0", "false", "no", "off")
+
+
+def _dump_name(f: Callable) -> str:
+    """'module.qualname', so same-named functions of different modules do not clash"""
+    return f"{f.__module__}.{f.__qualname__}".replace("<", "").replace(">", "")
+
+
+class _Aggregate:
+    """pstats of all the profiled calls of a single function"""
+
+    def __init__(self, name: str, dump_dir: Path, interval: Optional[float]) -> None:
+        self.name = name
+        self.dump_dir = dump_dir
+        self.interval = interval
+        self.calls = 0
+        self.stats: Optional[pstats.Stats] = None
+        self.lock = threading.Lock()
+        self.last_dump = time.monotonic()
+        atexit.register(self.dump)
+
+    @property
+    def path(self) -> Path:
+        return self.dump_dir / f"{self.name}.prof"
+
+    def add(self, prof: cProfile.Profile):
+        with self.lock:
+            self.calls += 1
+            if self.stats is None:
+                self.stats = pstats.Stats(prof)
+            else:
+                self.stats.add(prof)
+            due = self.interval is not None and time.monotonic() - self.last_dump >= self.interval
+        if due:
+            self.dump()
+
+    def dump(self):
+        """write the aggregated stats, loadable with snakeviz, pstats, ..."""
+        with self.lock:
+            if self.stats is None:
+                return
+            self.dump_dir.mkdir(parents=True, exist_ok=True)
+            self.stats.dump_stats(self.path)
+            self.last_dump = time.monotonic()
+
+
+# cProfile cannot nest (python >= 3.12 refuses a second active profiler)
+_ACTIVE = threading.local()
+
+
+def _run_profiled(f: Callable, args, kwargs) -> tuple[object, Optional[cProfile.Profile]]:
+    if getattr(_ACTIVE, "on", False):
+        return f(*args, **kwargs), None
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except ValueError:  # another profiler is running
+        return f(*args, **kwargs), None
+    _ACTIVE.on = True
+    try:
+        return f(*args, **kwargs), prof
+    finally:
+        prof.disable()
+        _ACTIVE.on = False
 
 
-def profile(f: Callable):
+async def _await_profiled(coro) -> tuple[object, Optional[cProfile.Profile]]:
+    if getattr(_ACTIVE, "on", False):
+        return await coro, None
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except ValueError:
+        return await coro, None
+    _ACTIVE.on = True
+    try:
+        return await coro, prof
+    finally:
+        prof.disable()
+        _ACTIVE.on = False
+
+
+def _print_stats(prof: cProfile.Profile):
+    results = pstats.Stats(prof)
+    results.sort_stats(pstats.SortKey.TIME)
+    results.print_stats()
+
+
+def profile(
+    f          : Optional[Callable] = None,
+    *,
+    rate       : float = 1.0,
+    dump_dir   : Optional[Path] = None,
+    interval   : Optional[float] = None,
+    print_each : bool = False,
+):
     """
-    basic profiler
+    cProfile-based profiler
+
+    * rate       : fraction of the calls that gets profiled
+    * dump_dir   : where the aggregated '<module.function>.prof' file goes (cwd by default)
+    * interval   : also dump every 'interval' seconds, not only at exit
+    * print_each : print the stats table of every profiled call (the old behaviour)
+
+    the return value is passed through, coroutine functions are supported
+    (the profiler also sees whatever runs on the event loop while awaiting).
+    unless PYUTILS_PROFILE is set the function is returned untouched
 
     Example
 
@@ -16,11 +144,586 @@ def profile(f: Callable):
     def your_func():
         ...
 
+    @profile(rate=0.01, interval=60)
+    def hot_func():
+        ...
+
     """
+    if f is None:
+        return functools.partial(profile, rate=rate, dump_dir=dump_dir, interval=interval, print_each=print_each)
+    if not profiling_enabled():
+        return f
+
+    agg = _Aggregate(_dump_name(f), Path(dump_dir or Path.cwd()), interval)
+
+    def collect(prof: Optional[cProfile.Profile]):
+        if prof is None:
+            return
+        agg.add(prof)
+        if print_each:
+            _print_stats(prof)
+
+    if inspect.iscoroutinefunction(f):
+        @functools.wraps(f)
+        async def aprofiled(*args, **kwargs):
+            if random.random() >= rate:
+                return await f(*args, **kwargs)
+            result, prof = await _await_profiled(f(*args, **kwargs))
+            collect(prof)
+            return result
+        aprofiled.dump = agg.dump
+        return aprofiled
+
+    @functools.wraps(f)
     def profiled(*args, **kwargs):
-        with cProfile.Profile() as profile:
-            f(*args, **kwargs)
-        results = pstats.Stats(profile)
-        results.sort_stats(pstats.SortKey.TIME)
-        results.print_stats()
+        if random.random() >= rate:
+            return f(*args, **kwargs)
+        result, prof = _run_profiled(f, args, kwargs)
+        collect(prof)
+        return result
+    profiled.dump = agg.dump
     return profiled
+
+# =============================================================================
+# statistical profiler
+
+class SamplingProfiler:
+    """
+    low overhead profiler: a background thread samples the stacks of the
+    other threads every 'interval' seconds and counts them
+
+    the output is the collapsed-stack format read by flamegraph.pl,
+    speedscope, inferno, ...
+
+    with SamplingProfiler() as sp:
+        work()
+    sp.write_collapsed(Path("work.folded"))
+
+    @sampled(Path("work.folded"))
+    def work(): ...
+    """
+
+    def __init__(self, interval: float = 0.005, all_threads: bool = True) -> None:
+        self.interval = interval
+        self.all_threads = all_threads
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self.samples = 0
+        self._labels: dict[object, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._target: Optional[int] = None
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _sample(self):
+        me = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == me or (not self.all_threads and ident != self._target):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._target = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def collapsed(self) -> Generator[str, None, None]:
+        """one 'frame;frame;frame count' line per distinct stack"""
+        for stack, count in self.stacks.most_common():
+            yield f"{';'.join(stack)} {count}"
+
+    def write_collapsed(self, f: Path):
+        with Path(f).open("w") as fp:
+            fp.writelines(line + "\n" for line in self.collapsed())
+
+
+def sampled(f_out: Path, interval: float = 0.005, all_threads: bool = False):
+    """decorator form of SamplingProfiler, appends each call to 'f_out'"""
+    def decorator(f: Callable):
+        if not profiling_enabled():
+            return f
+
+        @functools.wraps(f)
+        def inner(*args, **kwargs):
+            sp = SamplingProfiler(interval, all_threads)
+            try:
+                with sp:
+                    return f(*args, **kwargs)
+            finally:
+                if sp.samples:
+                    with Path(f_out).open("a") as fp:
+                        fp.writelines(line + "\n" for line in sp.collapsed())
+        return inner
+    return decorator
+
+# =============================================================================
+# memory profiler
+
+def _peak_rss() -> Optional[int]:
+    """peak resident set size of the process in bytes, if the os tells us"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _fmt_size(n: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(n) < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TiB"
+
+
+class MemoryReport(NamedTuple):
+    """outcome of a single profile_memory scope"""
+    name     : str
+    current  : int  # traced bytes still allocated at the end of the scope
+    peak     : int  # traced bytes at the highest point during the scope
+    peak_rss : Optional[int]
+    top      : list[tracemalloc.StatisticDiff]
+    growth   : list[tracemalloc.StatisticDiff]  # vs the previous call, see 'diff'
+
+    def __str__(self) -> str:
+        rss = "n/a" if self.peak_rss is None else _fmt_size(self.peak_rss)
+        lines = [f"{self.name}: net {_fmt_size(self.current)}, peak traced {_fmt_size(self.peak)}, peak rss {rss}"]
+        lines.append("top allocation sites:")
+        lines.extend(f"  {s}" for s in self.top)
+        if self.growth:
+            lines.append("growth since previous call:")
+            lines.extend(f"  {s}" for s in self.growth)
+        return "\n".join(lines)
+
+
+_MEM_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+    tracemalloc.Filter(False, __file__),
+)
+
+
+# tracemalloc is process-wide: the first scope to open (any thread, any
+# profile_memory) starts it, the last one to close stops it
+_TRACE_LOCK = threading.Lock()
+_trace_scopes = 0
+_trace_owned = False  # started here, not by the user or PYTHONTRACEMALLOC
+_trace_keep = False   # a diff=True profiler needs the traces between its calls
+
+
+def _trace_enter(keep: bool):
+    global _trace_scopes, _trace_owned, _trace_keep
+    with _TRACE_LOCK:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _trace_owned = True
+        _trace_scopes += 1
+        _trace_keep = _trace_keep or keep
+
+
+def _trace_exit():
+    global _trace_scopes, _trace_owned
+    with _TRACE_LOCK:
+        _trace_scopes -= 1
+        if _trace_scopes == 0 and _trace_owned and not _trace_keep:
+            tracemalloc.stop()
+            _trace_owned = False
+
+
+class profile_memory:
+    """
+    tracemalloc-based memory profiler, both a decorator and a context manager
+
+    * top        : how many allocation sites to report (by size, counts included)
+    * key_type   : "lineno", "filename" or "traceback" grouping
+    * diff       : also compare with the snapshot of the previous call, slow
+                   leaks show up as steady growth at the same site
+    * dump_dir   : where each report is appended to '<name>.mem.txt' (cwd by default)
+    * print_each : also print the report of every call
+
+    as a decorator it does nothing unless PYUTILS_PROFILE is set
+
+    Example
+
+    @profile_memory
+    def load_batch(): ...
+
+    @profile_memory(diff=True)
+    def load_batch(): ...
+
+    with profile_memory("parse"):
+        parse()
+    """
+
+    def __new__(cls, name=None, **kwargs):
+        if callable(name):  # bare @profile_memory
+            return cls(**kwargs)(name)
+        return super().__new__(cls)
+
+    def __init__(
+        self,
+        name       : Optional[str] = None,
+        *,
+        top        : int = 10,
+        key_type   : str = "lineno",
+        diff       : bool = False,
+        dump_dir   : Optional[Path] = None,
+        print_each : bool = False,
+    ) -> None:
+        self.name = name
+        self.top = top
+        self.key_type = key_type
+        self.diff = diff
+        self.dump_dir = Path(dump_dir or Path.cwd())
+        self.print_each = print_each
+        self.reports: list[MemoryReport] = []
+        self._last: Optional[tracemalloc.Snapshot] = None
+        self._local = threading.local()  # stack of the open scopes, per thread
+        self._lock = threading.Lock()
+
+    @property
+    def _scopes(self) -> list[tracemalloc.Snapshot]:
+        scopes = getattr(self._local, "scopes", None)
+        if scopes is None:
+            scopes = self._local.scopes = []
+        return scopes
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(_MEM_FILTERS)
+
+    def __enter__(self):
+        _trace_enter(self.diff)
+        tracemalloc.reset_peak()
+        self._scopes.append(self._snapshot())
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        scopes = self._scopes
+        if not scopes:
+            return
+        before = scopes.pop()
+        after = self._snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        _trace_exit()
+        top = after.compare_to(before, self.key_type)[:self.top]
+        with self._lock:
+            growth = []
+            if self.diff:
+                if self._last is not None:
+                    growth = [s for s in after.compare_to(self._last, self.key_type) if s.size_diff > 0][:self.top]
+                self._last = after
+            report = MemoryReport(
+                name     = self.name or "profile_memory",
+                current  = sum(s.size_diff for s in after.compare_to(before, "filename")),
+                peak     = peak,
+                peak_rss = _peak_rss(),
+                top      = top,
+                growth   = growth,
+            )
+            self.reports.append(report)
+            self._emit(report)
+
+    def _emit(self, report: MemoryReport):
+        if self.print_each:
+            print(report)
+        self.dump_dir.mkdir(parents=True, exist_ok=True)
+        with (self.dump_dir / f"{report.name}.mem.txt").open("a") as fp:
+            fp.write(f"{str(report)}\n\n")
+
+    def __call__(self, f: Callable):
+        if self.name is None:
+            self.name = _dump_name(f)
+        if not profiling_enabled():
+            return f
+
+        if inspect.iscoroutinefunction(f):
+            @functools.wraps(f)
+            async def aprofiled(*args, **kwargs):
+                with self:
+                    return await f(*args, **kwargs)
+            return aprofiled
+
+        @functools.wraps(f)
+        def profiled(*args, **kwargs):
+            with self:
+                return f(*args, **kwargs)
+        return profiled
+
+# =============================================================================
+# always-on timers
+
+# log-scale histogram: every power of two is split in 2^_SUB_BITS buckets,
+# so a percentile is off by at most 1/8 of the value
+_SUB_BITS = 3
+_SUB = 1 << _SUB_BITS
+_N_BUCKETS = 65 * _SUB
+_SUM = _N_BUCKETS  # the last slot of a shard holds the total nanoseconds
+
+
+def _bucket(ns: int) -> int:
+    if ns <= 0:
+        return 0
+    b = ns.bit_length()
+    shift = b - 1 - _SUB_BITS
+    sub = (ns >> shift if shift >= 0 else ns << -shift) & (_SUB - 1)
+    return b * _SUB + sub
+
+
+def _bucket_upper(idx: int) -> float:
+    """upper bound, in nanoseconds, of the values falling in bucket 'idx'"""
+    b, sub = divmod(idx, _SUB)
+    return (_SUB + sub + 1) * 2.0 ** (b - 1 - _SUB_BITS)
+
+
+class TimerStats(NamedTuple):
+    name    : str
+    count   : int
+    seconds : float  # total
+    p50     : float
+    p95     : float
+    p99     : float
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: n={self.count} total={self.seconds:.3f}s "
+            f"p50={self.p50 * 1e3:.3f}ms p95={self.p95 * 1e3:.3f}ms p99={self.p99 * 1e3:.3f}ms"
+        )
+
+
+class _ShardHolder:
+    """per-thread histogram of a Timer, its lifetime tracks the thread"""
+    __slots__ = ("counts", "starts", "__weakref__")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (_N_BUCKETS + 1)
+        self.starts: list[int] = []
+
+
+class Timer:
+    """
+    named latency histogram, cheap enough to leave on in production
+
+    each thread writes to its own shard of the histogram, so recording takes
+    no lock; reading merges the shards. the shard of a finished thread is
+    folded into a single accumulator, so thread-per-request servers do not
+    grow the timer
+
+    with timer("DataSource.query"):
+        ds.query(sql)
+
+    @timer("read_xlsheet")
+    def read_xlsheet(...): ...
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._local = threading.local()
+        self._shards: dict[int, list[int]] = {}  # live threads only
+        self._retired = [0] * (_N_BUCKETS + 1)   # what the dead threads recorded
+        self._lock = threading.Lock()
+
+    def _shard(self) -> list[int]:
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            holder = _ShardHolder()
+            self._local.holder = holder
+            with self._lock:
+                self._shards[id(holder.counts)] = holder.counts
+            # the thread-local dies with its thread, then the shard is folded
+            weakref.finalize(holder, self._retire, holder.counts)
+        return holder.counts
+
+    def _retire(self, counts: list[int]):
+        with self._lock:
+            self._shards.pop(id(counts), None)
+            for i, v in enumerate(counts):
+                if v:
+                    self._retired[i] += v
+
+    def record_ns(self, ns: int):
+        shard = self._shard()
+        shard[_bucket(ns)] += 1
+        shard[_SUM] += ns
+
+    def __enter__(self):
+        self._shard()
+        self._local.holder.starts.append(time.perf_counter_ns())
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.record_ns(time.perf_counter_ns() - self._local.holder.starts.pop())
+
+    def __call__(self, f: Callable):
+        @functools.wraps(f)
+        def timed(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                self.record_ns(time.perf_counter_ns() - start)
+        return timed
+
+    def _merged(self) -> list[int]:
+        with self._lock:
+            shards = list(self._shards.values())
+            merged = list(self._retired)
+        for shard in shards:
+            for i, v in enumerate(shard):
+                if v:
+                    merged[i] += v
+        return merged
+
+    def stats(self) -> TimerStats:
+        merged = self._merged()
+        count = sum(merged[:_SUM])
+
+        def percentile(q: float) -> float:
+            if not count:
+                return 0.0
+            rank = q * count
+            seen = 0
+            for i, v in enumerate(merged[:_SUM]):
+                seen += v
+                if seen >= rank:
+                    return _bucket_upper(i) / 1e9
+            return _bucket_upper(_SUM - 1) / 1e9
+
+        return TimerStats(self.name, count, merged[_SUM] / 1e9, percentile(0.50), percentile(0.95), percentile(0.99))
+
+    def reset(self):
+        """zero all the shards (counts recorded concurrently may be lost)"""
+        with self._lock:
+            for shard in self._shards.values():
+                shard[:] = [0] * len(shard)
+            self._retired[:] = [0] * len(self._retired)
+
+
+_TIMERS: dict[str, Timer] = {}
+_TIMERS_LOCK = threading.Lock()
+
+
+def timer(name: str) -> Timer:
+    """the Timer registered under 'name', created on first use"""
+    t = _TIMERS.get(name)
+    if t is None:
+        with _TIMERS_LOCK:
+            t = _TIMERS.setdefault(name, Timer(name))
+    return t
+
+
+def timers_stats() -> list[TimerStats]:
+    return [t.stats() for t in list(_TIMERS.values())]
+
+
+def timers_prometheus() -> str:
+    """all timers in the prometheus text exposition format (as summaries)"""
+    lines = [
+        "# HELP pyutils_timer_seconds latency of the named code sections",
+        "# TYPE pyutils_timer_seconds summary",
+    ]
+    for s in timers_stats():
+        label = s.name.replace("\\", "\\\\").replace('"', '\\"')
+        for q, v in (("0.5", s.p50), ("0.95", s.p95), ("0.99", s.p99)):
+            lines.append(f'pyutils_timer_seconds{{timer="{label}",quantile="{q}"}} {v:.9f}')
+        lines.append(f'pyutils_timer_seconds_sum{{timer="{label}"}} {s.seconds:.9f}')
+        lines.append(f'pyutils_timer_seconds_count{{timer="{label}"}} {s.count}')
+    return "\n".join(lines) + "\n"
+
+
+class TimerExporter:
+    """
+    periodically export every timer
+
+    * logger_name : log one line per timer at INFO level, e.g. the app name
+                    given to logger_setup.configure_logs
+    * prom_file   : atomically rewrite this file with timers_prometheus()
+                    (for the node_exporter textfile collector)
+    * reset       : zero the timers after each export (per-interval figures)
+    """
+
+    def __init__(
+        self,
+        interval    : float = 60.0,
+        logger_name : Optional[str] = None,
+        prom_file   : Optional[Path] = None,
+        reset       : bool = False,
+    ) -> None:
+        self.interval = interval
+        self.logger_name = logger_name
+        self.prom_file = None if prom_file is None else Path(prom_file)
+        self.reset = reset
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def export(self):
+        if self.logger_name is not None:
+            log = logging.getLogger(self.logger_name)
+            for s in timers_stats():
+                log.info("%s", s)
+        if self.prom_file is not None:
+            tmp = self.prom_file.with_suffix(self.prom_file.suffix + ".tmp")
+            tmp.write_text(timers_prometheus())
+            os.replace(tmp, self.prom_file)
+        if self.reset:
+            for t in list(_TIMERS.values()):
+                t.reset()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.export()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="TimerExporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.export()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,130 @@
+from pathlib import Path
+import re
+import tempfile
+import unittest
+
+import greppy
+
+
+def make_args(expr: str, path: Path, flags: int = 0, **kwargs) -> greppy.Args:
+    e = re.compile(expr, flags)
+    return greppy.Args(
+        e, path, True, bool(flags & re.I), True, 1,
+        greppy._bytes_expr(e), greppy._required_literal(e), **kwargs
+    )
+
+
+def can_encode(text: str) -> bool:
+    try:
+        text.encode(greppy.ENCODING)
+    except UnicodeError:
+        return False
+    return True
+
+
+class TestGreppy(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, rel: str, data: bytes = b"x\n") -> Path:
+        f = self.root / rel
+        f.parent.mkdir(parents=True, exist_ok=True)
+        f.write_bytes(data)
+        return f
+
+    # engines ------------------------------------------------------------------
+
+    def assert_same_engines(self, args: greppy.Args, f: Path):
+        self.assertEqual(list(args.matches(f)), list(args._replace(bexpr=None).matches(f)))
+
+    def test_crlf_dollar(self):
+        f = self.write("a.txt", b"hello world\r\nworld peace\r\n")
+        args = make_args("world$", f)
+        self.assertIsNone(args.bexpr)
+        self.assertEqual(list(args.matches(f)), [(1, "hello world")])
+
+    def test_word_class(self):
+        if not can_encode("é"):
+            self.skipTest(f"{greppy.ENCODING} can not encode the sample")
+        f = self.write("a.txt", "café au lait\r\n".encode(greppy.ENCODING))
+        args = make_args(r"caf\w ", f)
+        self.assertIsNone(args.bexpr)
+        self.assertEqual(list(args.matches(f)), [(1, "café au lait")])
+
+    def test_ignorecase(self):
+        f = self.write("a.txt", b"Hello\r\nHELLO\r\nbye\r\n")
+        args = make_args("hello", f, re.I)
+        self.assertIsNone(args.bexpr)
+        self.assertEqual([i for i, _ in args.matches(f)], [1, 2])
+
+    def test_bytes_engine_same_lines(self):
+        f = self.write("a.txt", b"ab cd\r\nx_1 yz\r\nworld\r\n\r\nfoo bar baz\n" * 20)
+        for expr in ("ld.+", "ld.*", "^x", "a|z", "[a-c]d", "(ab|yz)", "o+", "ba.*z"):
+            args = make_args(expr, f)
+            self.assertIsNotNone(args.bexpr, expr)
+            self.assert_same_engines(args, f)
+
+    # .gitignore ---------------------------------------------------------------
+
+    def test_gitignore(self):
+        self.write(".gitignore", b"/build\n**/gen/*.py\n*.log\n!keep.log\ntmp/\n")
+        for rel in (
+            "build/a.txt", "src/build/b.txt",
+            "src/gen/x.py", "src/gen/x.txt", "a/b/gen/y.py",
+            "debug.log", "keep.log",
+            "tmp/c.txt", "src/tmp",
+            ".git/config",
+        ):
+            self.write(rel)
+        args = make_args("x", self.root)
+        found = {p.relative_to(self.root).as_posix() for p in args.walk_files(self.root)}
+        expected = {".gitignore", "src/build/b.txt", "src/gen/x.txt", "keep.log", "src/tmp"}
+        self.assertEqual(found, expected)
+
+    def test_nested_gitignore(self):
+        self.write("sub/.gitignore", b"/only_here.txt\n")
+        self.write("sub/only_here.txt")
+        self.write("only_here.txt")
+        args = make_args("x", self.root)
+        found = {p.relative_to(self.root).as_posix() for p in args.walk_files(self.root)}
+        self.assertEqual(found, {"sub/.gitignore", "only_here.txt"})
+
+    # trigram index ------------------------------------------------------------
+
+    def test_index_root_bounds(self):
+        foo = self.write("foo/a.txt", b"needle\n").parent
+        foobar = self.write("foobar/c.txt", b"needle\n").parent
+        idx = greppy.TrigramIndex(self.root / "idx.db")
+        try:
+            idx.update(foobar, [foobar / "c.txt"])
+            idx.update(foo, [foo / "a.txt"])
+            self.assertEqual(idx.candidates(foo, [b"needle"]), [foo / "a.txt"])
+            self.assertEqual(idx.files(foo), [foo / "a.txt"])
+            # refreshing foo must not forget foobar
+            self.assertEqual(idx.candidates(foobar, [b"needle"]), [foobar / "c.txt"])
+            self.assertEqual(idx.files(foo / "a.txt"), [foo / "a.txt"])
+        finally:
+            idx.close()
+
+    # search_file --------------------------------------------------------------
+
+    def test_count_after_decode_error(self):
+        # past the first read buffer, so the good lines are decoded first
+        data = b"hit one\nhit two\n" + b"x" * 9000 + b"\n\x81 bad\nhit three\n"
+        f = self.write("a.txt", data)
+        args = make_args(r"h\w+", f, c=True)
+        self.assertEqual(args.search_file(f), [f"{f}: 2", f"UnicodeDecodeError on file: {f}"])
+        args = make_args(r"h\w+", f)
+        self.assertEqual(
+            args.search_file(f),
+            [f"{f}: 1: hit one", f"{f}: 2: hit two", f"UnicodeDecodeError on file: {f}"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
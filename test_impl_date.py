@@ -3,6 +3,11 @@ import unittest
 
 import impl_date
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 class TestImpl_Date(unittest.TestCase):
 
@@ -153,5 +158,147 @@ class TestImpl_Date(unittest.TestCase):
             self.assertEqual(impl_date.next_friday(inpt), expected)
 
 
+
+class TestSchedules(unittest.TestCase):
+
+    def test_add_months(self):
+        cases = (
+            (date(2026, 3, 31), -1,  date(2026, 2, 28)),
+            (date(2024, 3, 31), -13, date(2023, 2, 28)),
+            (date(2026, 1, 31), 25,  date(2028, 2, 29)),
+            (date(2026, 5, 15), -12, date(2025, 5, 15)),
+            (date(2026, 5, 15), 0,   date(2026, 5, 15)),
+        )
+        for d, n, expected in cases:
+            self.assertEqual(impl_date.add_months(d, n), expected)
+        self.assertEqual(impl_date.add_quarters(date(2026, 11, 30), 1), date(2027, 2, 28))
+        self.assertEqual(impl_date.add_years(date(2024, 2, 29), 4), date(2028, 2, 29))
+        self.assertEqual(impl_date.add_years(date(2024, 2, 29), -1), date(2023, 2, 28))
+
+    def test_days_in_month(self):
+        self.assertEqual(impl_date.days_in_month(2024, 2), 29)
+        self.assertEqual(impl_date.days_in_month(1900, 2), 28)
+        self.assertEqual(impl_date.days_in_month(2000, 2), 29)
+        self.assertEqual(impl_date.days_in_month(2026, 4), 30)
+
+    def test_month_ends(self):
+        got = list(impl_date.month_ends(date(2024, 1, 31), date(2024, 4, 29)))
+        self.assertEqual(got, [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31)])
+        got = list(impl_date.quarter_ends(date(2025, 12, 31), date(2026, 9, 29)))
+        self.assertEqual(got, [date(2025, 12, 31), date(2026, 3, 31), date(2026, 6, 30)])
+
+    def test_nth_weekday_of_month(self):
+        third_fri = impl_date.nth_weekday_of_month(date(2026, 1, 17), date(2026, 4, 30), impl_date.WEEKDAY_FRI, 3)
+        self.assertEqual(list(third_fri), [date(2026, 2, 20), date(2026, 3, 20), date(2026, 4, 17)])
+        last_mon = impl_date.nth_weekday_of_month(date(2026, 5, 1), date(2026, 6, 30), impl_date.WEEKDAY_MON, -1)
+        self.assertEqual(list(last_mon), [date(2026, 5, 25), date(2026, 6, 29)])
+        fifth_fri = impl_date.nth_weekday_of_month(date(2026, 1, 1), date(2026, 3, 31), impl_date.WEEKDAY_FRI, 5)
+        self.assertEqual(list(fifth_fri), [date(2026, 1, 30)])
+        for weekday, n in ((9, 1), (-1, 1), (impl_date.WEEKDAY_MON, 0), (impl_date.WEEKDAY_MON, 6)):
+            with self.assertRaises(ValueError):
+                list(impl_date.nth_weekday_of_month(date(2024, 1, 1), date(2024, 2, 29), weekday, n))
+
+    def test_business_days(self):
+        got = list(impl_date.business_days(date(2026, 4, 4), date(2026, 4, 13), holidays=[date(2026, 4, 6)]))
+        expected = [date(2026, 4, d) for d in (7, 8, 9, 10, 13)]
+        self.assertEqual(got, expected)
+
+
+class TestBusinessCalendar(unittest.TestCase):
+
+    def setUp(self):
+        self.holidays = (date(2026, 4, 6), date(2026, 5, 1), date(2026, 12, 25))
+        self.cal = impl_date.BusinessCalendar(date(2026, 1, 1), date(2026, 12, 31), self.holidays)
+
+    def test_is_business_day(self):
+        self.assertTrue(impl_date.BusinessCalendar(date(2026, 1, 1), date(2026, 1, 1)).is_business_day(date(2026, 1, 1)))
+        self.assertFalse(self.cal.is_business_day(date(2026, 4, 6)))   # holiday
+        self.assertFalse(self.cal.is_business_day(date(2026, 4, 4)))   # saturday
+        self.assertTrue(self.cal.is_business_day(date(2026, 4, 7)))
+
+    def test_roll(self):
+        self.assertEqual(self.cal.roll(date(2026, 4, 4)), date(2026, 4, 7))
+        self.assertEqual(self.cal.roll(date(2026, 4, 6), impl_date.PRECEDING), date(2026, 4, 3))
+        self.assertEqual(self.cal.roll(date(2026, 4, 7)), date(2026, 4, 7))
+
+    def test_add(self):
+        cases = (
+            (date(2026, 4, 2), 2, date(2026, 4, 7)),
+            (date(2026, 4, 30), 1, date(2026, 5, 4)),
+            (date(2026, 4, 7), -1, date(2026, 4, 3)),
+            (date(2026, 4, 4), 0, date(2026, 4, 7)),
+        )
+        for d, n, expected in cases:
+            self.assertEqual(self.cal.add(d, n), expected)
+
+    def test_count(self):
+        self.assertEqual(self.cal.count(date(2026, 4, 1), date(2026, 4, 8)), 4)
+        self.assertEqual(self.cal.count(date(2026, 4, 8), date(2026, 4, 1)), -4)
+        self.assertEqual(self.cal.count(date(2026, 1, 1), date(2027, 1, 1)), 261 - 3)
+
+    def test_weekmask(self):
+        cal = impl_date.BusinessCalendar(date(2026, 4, 1), date(2026, 4, 30), weekmask="1111110")
+        self.assertTrue(cal.is_business_day(date(2026, 4, 4)))
+        self.assertEqual(cal.add(date(2026, 4, 4), 1), date(2026, 4, 6))
+
+    def test_out_of_range(self):
+        with self.assertRaises(ValueError):
+            self.cal.add(date(2025, 12, 31), 1)
+        with self.assertRaises(ValueError):
+            self.cal.add(date(2026, 12, 30), 5)
+
+
+@unittest.skipIf(np is None, "numpy not available")
+class TestImpl_Date_Vectorized(unittest.TestCase):
+
+    def setUp(self):
+        start = date(1999, 12, 1)
+        self.days = [start + timedelta(days=i) for i in range(366 * 6)]
+        self.arr = np.array(self.days, dtype="datetime64[D]")
+
+    def _check(self, name):
+        scalar = getattr(impl_date, name)
+        vec = getattr(impl_date, f"vec_{name}")
+        got = vec(self.arr).tolist()
+        expected = [scalar(d) for d in self.days]
+        self.assertEqual(got, expected, name)
+
+    def test_same_as_scalar(self):
+        names = (
+            "prev_day", "next_day", "prev_week", "next_week",
+            "prev_month", "next_month", "prev_year", "next_year",
+            "quarter", "semester",
+            "start_of_month", "end_of_month", "start_of_year", "end_of_year",
+            "start_of_week", "end_of_week", "is_weekend", "is_workday",
+            "previous_working_day", "next_working_day",
+            "previous_monday", "next_monday", "previous_friday", "next_friday",
+        )
+        for name in names:
+            self._check(name)
+
+    def test_add_months_array(self):
+        d = np.array(["2024-01-31", "2024-03-31", "2023-12-15"], dtype="datetime64[D]")
+        got = impl_date.vec_add_months(d, np.array([1, -13, 2])).tolist()
+        self.assertEqual(got, [date(2024, 2, 29), date(2023, 2, 28), date(2024, 2, 15)])
+
+    def test_nat(self):
+        d = np.array(["2024-01-31", "NaT"], dtype="datetime64[D]")
+        self.assertTrue(np.isnat(impl_date.vec_end_of_month(d)[1]))
+        self.assertEqual(impl_date.vec_quarter(d).tolist(), [1, 0])
+
+    def test_business_calendar(self):
+        holidays = [date(2001, 1, 1), date(2003, 12, 25), date(2004, 7, 5)]
+        cal = impl_date.BusinessCalendar(date(1999, 1, 1), date(2010, 12, 31), holidays)
+        hol = np.array(holidays, dtype="datetime64[D]")
+        self.assertEqual(cal.vec_is_business_day(self.arr).tolist(), [cal.is_business_day(d) for d in self.days])
+        self.assertEqual(cal.vec_roll(self.arr).tolist(), [cal.roll(d) for d in self.days])
+        for n in (-3, 0, 1, 10):
+            got = cal.vec_add(self.arr, n)
+            self.assertEqual(got.tolist(), [cal.add(d, n) for d in self.days])
+            self.assertTrue((got == np.busday_offset(self.arr, n, roll="forward", holidays=hol)).all())
+        end = self.arr + 17
+        self.assertTrue((cal.vec_count(self.arr, end) == np.busday_count(self.arr, end, holidays=hol)).all())
+
+
 if __name__ == "__main__":
     unittest.main()
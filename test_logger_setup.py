@@ -0,0 +1,107 @@
+import contextlib
+import io
+import json
+import logging
+from pathlib import Path
+import shutil
+import unittest
+import uuid
+
+import logger_setup
+
+
+LOG_DIR = Path(logger_setup.__file__).parent / "logs"
+
+
+class TestConfigureLogs(unittest.TestCase):
+
+    def setUp(self):
+        self.had_logs = LOG_DIR.exists()
+        self.name = f"test_{uuid.uuid4().hex}"
+        self.out = io.StringIO()
+        self.listener = None
+
+    def tearDown(self):
+        if self.listener is not None:
+            self.listener.stop()
+            for h in self.listener.handlers:
+                h.close()
+        log = logging.getLogger(self.name)
+        for h in list(log.handlers):
+            log.removeHandler(h)
+            h.close()
+        if not self.had_logs:
+            shutil.rmtree(LOG_DIR, ignore_errors=True)
+
+    def configure(self, **kwargs):
+        with contextlib.redirect_stdout(self.out):
+            self.listener = logger_setup.configure_logs(self.name, **kwargs)
+
+    def printed(self) -> list[str]:
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener.start()
+        return self.out.getvalue().splitlines()
+
+    def test_child_logger_sampled_out(self):
+        self.configure(sample={logging.DEBUG: 0.0})
+        child = logging.getLogger(f"{self.name}.db")
+        child.debug("dropped")
+        child.info("kept")
+        lines = self.printed()
+        self.assertEqual(len(lines), 1)
+        self.assertIn("kept", lines[0])
+
+    def test_child_logger_sampled_in(self):
+        self.configure(sample={logging.DEBUG: 1.0})
+        logging.getLogger(f"{self.name}.db").debug("kept")
+        self.assertEqual(len(self.printed()), 1)
+
+    def test_unsampled_level_below_level(self):
+        self.configure(sample={logging.DEBUG: 1.0}, level=logging.WARNING)
+        child = logging.getLogger(f"{self.name}.db")
+        child.info("dropped")
+        child.debug("kept")
+        lines = self.printed()
+        self.assertEqual(len(lines), 1)
+        self.assertIn("kept", lines[0])
+
+    def test_child_logger_rate_limited(self):
+        self.configure(rate_limit=2)
+        child = logging.getLogger(f"{self.name}.db")
+        for i in range(10):
+            child.info("burst %d", i)
+        self.assertEqual(len(self.printed()), 2)
+
+    def test_child_logger_async(self):
+        self.configure(asynchronous=True, sample={logging.DEBUG: 0.0})
+        child = logging.getLogger(f"{self.name}.db")
+        child.debug("dropped")
+        child.info("kept")
+        lines = self.printed()
+        self.assertEqual(len(lines), 1)
+        self.assertIn("kept", lines[0])
+
+    def test_async_json_exception(self):
+        self.configure(asynchronous=True, json_format=True)
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logging.getLogger(self.name).exception("failed %d", 1)
+        out = json.loads(self.printed()[0])
+        self.assertEqual(out["msg"], "failed 1")
+        self.assertIn("ZeroDivisionError", out["exc"])
+
+    def test_handlers_agree(self):
+        self.configure(sample={logging.DEBUG: 0.5})
+        log = logging.getLogger(self.name)
+        for i in range(200):
+            log.debug("%s %d", self.name, i)
+        printed = [line for line in self.printed() if self.name in line]
+        with (LOG_DIR / "rotating.log").open() as fp:
+            written = [line.rstrip("\n") for line in fp if self.name in line]
+        self.assertEqual(printed, written)
+
+
+if __name__ == "__main__":
+    unittest.main()